@@ -1,108 +1,91 @@
-from pkgutil import get_data
-import netCDF4 as nc
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
+from concurrent.futures import ThreadPoolExecutor
 import utils
+import frames
 
 from matplotlib import collections  as mc
 
 class AnimatedScatter(object):
-   """An animated scatter plot using matplotlib.animations.FuncAnimation."""
-   def __init__(self, filename):
-      numpoints = 50
-      self.numpoints = numpoints
-      self.stream = self.data_stream()
-      self.ds = utils.get_dataset(filename)
-      self.timesteps = np.size(self.ds['time'])
-      self.Vneighs = self.ds['Vneighs']
-      self.vpos = self.ds.variables['pos'][:]
-      self.vpos_x = self.vpos[:][::2]
-      self.vpos_y = self.vpos[:][1::2]
-      self.cell_pos = self.ds['cellPositions'][:] # 7 rows x 400 columns (200 pairs of x,y)
-      self.box_side_len = self.ds.variables['BoxMatrix'][0][0];
+   """An animated scatter plot using matplotlib.animations.FuncAnimation.
+
+   The cell positions and cell edges are drawn by one scatter and one LineCollection, created
+   once and updated in place every frame. While a frame is on screen, the next one is read and
+   its edge segments are built on a background thread, into the other of two preallocated
+   segment buffers. The buffers alternate on every prepared frame (not by frame parity), so
+   the prefetch never writes into the buffer on screen, even when the animation wraps around
+   an odd number of timesteps.
+   """
+   def __init__(self, filename, interval=200):
+      # the trajectory is streamed in blocks of timesteps, so it never has to fit in memory;
+      # the topology is only decoded when it changes
+      self.reader = frames.TrajectoryReader(filename, ('pos', 'Vneighs', 'cellPositions', 'BoxMatrix'))
+      self.timesteps = len(self.reader)
+      self.executor = ThreadPoolExecutor(max_workers=1)
+      self.buffers = [np.empty((0, 2, 2)), np.empty((0, 2, 2))]
+      self.next_buffer = 0
+      self.pending = None
+      self.scat = None
+      self.lines = None
       # Setup the figure and axes...
       self.fig, self.ax = plt.subplots()
       # Then setup FuncAnimation.
-      self.ani = animation.FuncAnimation(self.fig, self.update, interval=200, 
+      self.ani = animation.FuncAnimation(self.fig, self.update, frames=self.timesteps, interval=interval,
                                           init_func=self.setup_plot, blit=True)
 
-   def setup_plot(self):
-      """Initial drawing of the scatter plot."""
-      xy =self.ds['cellPositions'][:] 
-      x = xy[0][::2]
-      y = xy[0][1::2]
-      line = []
-      curr = 0
-      for k in range(0, 1200, 3):
-         for j in range(0, 3):
-            v = self.Vneighs[0][k+j]
-            cur_p = (self.vpos_x[0][curr], self.vpos_y[0][curr])
-            p = (self.vpos_x[0][v], self.vpos_y[0][v])
-            point_diff = np.subtract(np.asarray(cur_p), np.asarray(p))
-            if np.linalg.norm(point_diff) < self.box_side_len/2:
-               line.append([cur_p, p]);
-            else:
-               if point_diff[0] > self.box_side_len/2:
-                  point_diff[0] -= self.box_side_len
-               if point_diff[0] < -self.box_side_len/2:
-                  point_diff[0] += self.box_side_len
-               if point_diff[1] > self.box_side_len/2:
-                  point_diff[1] -= self.box_side_len
-               if point_diff[1] < -self.box_side_len/2:
-                  point_diff[1] += self.box_side_len
-               line.append([cur_p, utils.tuple_sub(cur_p, point_diff)])
-               line.append([p, utils.tuple_add(p, point_diff)])
-         curr += 1
-      self.scat = self.ax.scatter(x, y, vmin=0, vmax=1,
-                                 cmap="jet", edgecolor="k")
-      # For FuncAnimation's sake, we need to return the artist we'll be using
-      # Note that it expects a sequence of artists, thus the trailing comma.
-      return self.scat,
+   def prepare_frame(self, i):
+      """Reads frame i and builds its edge segments into the next of the two buffers (frames are
+      only prepared on the executor thread, one at a time).
+
+      return : (Nc, 2) cell positions, (E, 2, 2) view of the segment buffer, box side lengths
+      """
+      frame = self.reader.frame(i)
+      segments = utils.build_edge_segments(frame['pos'], frame['Vneighs'], frame['BoxMatrix'], unique=True)
+      slot = self.next_buffer
+      self.next_buffer ^= 1
+      buffer = self.buffers[slot]
+      if len(buffer) < len(segments):
+         # every edge is split into at most two segments
+         buffer = self.buffers[slot] = np.empty((3 * len(frame['pos']), 2, 2))
+      buffer[:len(segments)] = segments
+      return frame['cellPositions'], buffer[:len(segments)], utils.get_box_lengths(frame['BoxMatrix'])
 
-   def data_stream(self):
-      xy =self.ds['cellPositions'][:] 
-      curr = 0
-      i = 1
-      while i < self.timesteps:
-         x = xy[i][::2]
-         y = xy[i][1::2]
-         line = []
-         for k in range(0, 1200, 3):
-            for j in range(0, 3):
-               v = self.Vneighs[i][k+j]
-               cur_p = (self.vpos_x[i][curr], self.vpos_y[i][curr])
-               p = (self.vpos_x[i][v], self.vpos_y[i][v])
-               point_diff = np.subtract(np.asarray(cur_p), np.asarray(p))
-               if np.linalg.norm(point_diff) < self.box_side_len/2:
-                  line.append([cur_p, p]);
-               else:
-                  if point_diff[0] > self.box_side_len/2:
-                     point_diff[0] -= self.box_side_len
-                  if point_diff[0] < -self.box_side_len/2:
-                     point_diff[0] += self.box_side_len
-                  if point_diff[1] > self.box_side_len/2:
-                     point_diff[1] -= self.box_side_len
-                  if point_diff[1] < -self.box_side_len/2:
-                     point_diff[1] += self.box_side_len
-                  line.append([cur_p, utils.tuple_sub(cur_p, point_diff)])
-                  line.append([p, utils.tuple_add(p, point_diff)])
-            curr += 1
-         i += 1
-         print('gh')
-         yield np.c_[x, y, line]
+   def get_frame(self, i):
+      """Returns the prepared frame i (waiting for the prefetch if needed) and starts
+      prefetching the frame after it."""
+      if self.pending is not None and self.pending[0] == i:
+         data = self.pending[1].result()
+      else:
+         data = self.executor.submit(self.prepare_frame, i).result()
+      following = (i + 1) % self.timesteps
+      self.pending = (following, self.executor.submit(self.prepare_frame, following))
+      return data
+
+   def setup_plot(self):
+      """Initial drawing of the scatter plot (FuncAnimation calls this again on resize, so the
+      artists are only created once)."""
+      cell_pos, segments, box = self.get_frame(0)
+      if self.scat is None:
+         self.ax.set_xlim(0, box[0])
+         self.ax.set_ylim(0, box[1])
+         self.scat = self.ax.scatter(cell_pos[:, 0], cell_pos[:, 1], edgecolor="k")
+         self.lines = mc.LineCollection(segments, linewidths=1, colors='k')
+         self.ax.add_collection(self.lines)
+      else:
+         self.scat.set_offsets(cell_pos)
+         self.lines.set_segments(segments)
+      # For FuncAnimation's sake, we need to return the artists we'll be using
+      return self.scat, self.lines
 
    def update(self, i):
-      """Update the scatter plot."""
-      data = next(self.stream)
+      """Update the scatter plot and the cell edges in place."""
+      cell_pos, segments, box = self.get_frame(i)
       # Set x and y data... (cell positions)
-      self.scat.set_offsets(data[0:2])
-
-      lc = mc.LineCollection(data[2], linewidths=1)
-      ax.add_collection(lc)
-      # We need to return the updated artist for FuncAnimation to draw..
-      # Note that it expects a sequence of artists, thus the trailing comma.
-      return self.scat,
+      self.scat.set_offsets(cell_pos)
+      self.lines.set_segments(segments)
+      # We need to return the updated artists for FuncAnimation to draw..
+      return self.scat, self.lines
 
 
 if __name__ == '__main__':
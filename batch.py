@@ -0,0 +1,402 @@
+import argparse
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import cache
+import frames
+import metrics
+import pipeline
+import profiling
+import store
+import utils
+
+# one loader per worker process, so consecutive frames with the same topology reuse its decoded arrays
+_loader = frames.FrameLoader(('pos', 'Vneighs', 'VertexCellNeighbors', 'cellVer', 'cellVerNum', 'cellType',
+                              'BoxMatrix'))
+# one boundary tracker per worker process: consecutive frames of a run only reclassify the
+# edges around their topology changes
+_tracker = utils.BoundaryTracker()
+
+# part of every cache key; bump it when a change to the analysis makes cached results stale
+CACHE_VERSION = 6
+
+logger = logging.getLogger(__name__)
+
+# analysis stages of analyse_frame; 'roughness' and 'internalization' need the curves of 'sweep'
+STAGES = ('boundary', 'sweep', 'roughness', 'internalization')
+
+DEFAULT_PATTERN = r"..\celldiv2.8-FIG4DATA\SLOWcelldivON\cellGPU_mesectoderm-ectoderm_02082021\data\*.nc"
+
+def read_frame(path, num_it=0):
+    """
+    Reads the raw time slices of a frame without decoding them (see frames.FrameLoader.read)
+
+    return : tuple : the raw slices and the number of vertices and cells
+    """
+    with utils.get_dataset(path) as ds:
+        return _loader.read(ds, num_it)
+
+def load_boundary(path, num_it=0, profiler=profiling.DISABLED, raw=None):
+    """
+    Reads a frame, finds its mesectoderm boundary lines and summarises its cell geometry
+
+    profiler : profiling.StageProfiler timing the read, decode, boundary and geometry stages
+    raw : the frame as already read by read_frame, if it was (it is read from path otherwise)
+
+    return : dict : 'lines', the (B, 2, 2) boundary segments, 'box_side_len', the total
+             'boundary_length' and the 'mean_area', 'mean_perimeter', 'mean_shape_index' of all
+             cells and 'mes_shape_index' of the mesectoderm cells
+    """
+    if raw is None:
+        with profiler.stage('read'):
+            raw = read_frame(path, num_it)
+    raw, num_v, num_cell = raw
+    with profiler.stage('decode'):
+        frame = _loader.decode(raw, num_it, num_v=num_v, num_cell=num_cell)
+    with profiler.stage('boundary'):
+        boundary_edges = _tracker.update(frame['Vneighs'], frame['VertexCellNeighbors'], frame['cellType'])
+        box = utils.get_box_lengths(frame['BoxMatrix'])
+        lines = frame['pos'][boundary_edges]
+        edge_vectors = lines[:, 1] - lines[:, 0]
+        edge_vectors -= box * np.round(edge_vectors / box)
+    with profiler.stage('geometry'):
+        geometry = utils.cell_geometry(frame['pos'], frame['cellVer'], frame['cellVerNum'], box)
+    is_mes = frame['cellType'] == 1
+    return {'lines': lines, 'box_side_len': box[0],
+            'boundary_length': np.hypot(edge_vectors[:, 0], edge_vectors[:, 1]).sum(),
+            'mean_area': geometry['area'].mean(),
+            'mean_perimeter': geometry['perimeter'].mean(),
+            'mean_shape_index': geometry['shape_index'].mean(),
+            'mes_shape_index': geometry['shape_index'][is_mes].mean() if is_mes.any() else np.nan}
+
+def image_filename(image_dir, path, num_it=0):
+    """
+    return : str : the file the rendered boundary of a frame is saved to: named after the frame
+             file, with the time index appended for the later slices of multi-timestep files
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(image_dir, stem + ('_t{:05d}'.format(num_it) if num_it else '') + '.png')
+
+def render_boundary(path, boundary, axis_window, image_dir, profiler=profiling.DISABLED, image_sink=None, num_it=0):
+    """
+    Renders the boundary lines of a frame in memory, and saves the image to image_dir (see
+    image_filename) if it is given
+
+    image_sink : function(filename, image) that saves the image; by default it is written here
+                 with utils.write_image, timed as the 'save_image' stage
+
+    return : numpy.ndarray : the BGR image
+    """
+    with profiler.stage('render'):
+        image = utils.render_boundary_image(boundary['lines'], float(boundary['box_side_len']), axis_window)
+    if image_dir is None:
+        return image
+    filename = image_filename(image_dir, path, num_it)
+    if image_sink is not None:
+        image_sink(filename, image)
+    else:
+        with profiler.stage('save_image'):
+            utils.write_image(filename, image)
+    return image
+
+def extract_curves(path, boundary, axis_window, boundary_mode, image_dir, profiler=profiling.DISABLED,
+                   image_sink=None, num_it=0):
+    """
+    Extracts the upper and lower boundary curves of a frame from its boundary lines,
+    geometrically or through a rendered image (boundary_mode 'image'). Both modes give the
+    curves in simulation coordinates, so the metrics computed from them have the same units.
+
+    return : dict : 'upper' and 'lower' (N, 2) arrays of boundary points
+    """
+    lines, box_side_len = boundary['lines'], float(boundary['box_side_len'])
+    if boundary_mode == 'image' or image_dir is not None:
+        image = render_boundary(path, boundary, axis_window, image_dir, profiler, image_sink, num_it)
+    with profiler.stage('sweep'):
+        if boundary_mode == 'image':
+            upperboundary, lowerboundary = (metrics.pixels_to_coords(points, axis_window, image.shape[1::-1])
+                                            for points in utils.sweeper(image))
+        else:
+            upperboundary, lowerboundary = utils.boundary_curves_from_lines(lines, box_side_len, axis_window)
+    return {'upper': np.asarray(upperboundary, dtype=float), 'lower': np.asarray(lowerboundary, dtype=float)}
+
+def analyse_frame(path, num_it=0, segment_length=metrics.DEFAULT_SEGMENT_LENGTH, axis_window=(0, 20, 8, 12),
+                  boundary_mode='geometry', image_dir=None, cache_dir=None, cache_size=cache.DEFAULT_MAX_BYTES,
+                  profile_log=None, trace_memory=False, stages=STAGES, raw=None, image_sink=None,
+                  threshold=metrics.DEFAULT_THRESHOLD):
+    """
+    Runs the analysis pipeline on a single nc frame file: finds the mesectoderm boundary and
+    summarises the cell geometry, extracts the upper and lower boundary curves (geometrically,
+    or through a rendered image when boundary_mode is 'image'), rotates them and computes the
+    roughness of the upper boundary and the mesectoderm internalization and width statistics.
+    Every metric is in simulation units, whichever boundary_mode is used.
+
+    segment_length : length (simulation units) of the segments the roughness is averaged over
+
+    image_dir : directory to save the rendered boundary images to (optional debug output; the
+                'image' mode sweeps the rendered image in memory)
+    cache_dir : directory of the on-disk cache of the boundary, curves and metrics of each
+                frame (no caching if not given); each stage is keyed by its own parameters and
+                those of the stages before it
+    cache_size : size limit of the cache in bytes
+    profile_log : JSON lines file the time and memory use of every stage are appended to (see
+                  profiling.StageProfiler); no profiling if not given
+    trace_memory : whether the profile also records Python allocations with tracemalloc
+    stages : the STAGES to run; the boundary and cell geometry metrics are always computed,
+             the curves only if 'sweep', 'roughness' or 'internalization' is requested
+    raw : the frame as already read by read_frame (it is read from path if not given)
+    image_sink : function(filename, image) saving the rendered images (utils.write_image by default)
+    threshold : width (in simulation units) at or below which a column counts as internalized
+    return : dict : the value of every store.COLUMNS metric of the frame (metrics of stages
+             that did not run are nan), or None if the frame has no mesectoderm boundary to
+             extract curves from (utils.NoBoundaryError); such frames are not cached
+    """
+    frame_cache = cache.open_cache(cache_dir, cache_size) if cache_dir is not None else None
+    profiler = profiling.get_profiler(profile_log, trace_memory)
+    profiler.frame(path=path, num_it=num_it)
+    boundary_params = {'num_it': num_it, 'version': CACHE_VERSION}
+    curve_params = dict(boundary_params, axis_window=list(axis_window), boundary_mode=boundary_mode)
+    metric_params = dict(curve_params, segment_length=segment_length, stages=sorted(stages), threshold=threshold)
+
+    def compute_metrics():
+        boundary = cache.cached(frame_cache, path, 'boundary', boundary_params,
+                                lambda: load_boundary(path, num_it, profiler, raw))
+        values = {name: float(boundary[name]) for name in store.COLUMNS if name in boundary}
+        values.update(roughness=np.nan, internalization=np.nan, mean_width=np.nan, width_variance=np.nan)
+        if not set(stages) & {'sweep', 'roughness', 'internalization'}:
+            if image_dir is not None:
+                render_boundary(path, boundary, axis_window, image_dir, profiler, image_sink, num_it)
+            return values
+        curves = cache.cached(frame_cache, path, 'curves', curve_params,
+                              lambda: extract_curves(path, boundary, axis_window, boundary_mode, image_dir,
+                                                     profiler, image_sink, num_it))
+        if 'roughness' in stages:
+            with profiler.stage('rotate'):
+                r_upper_boundary, r_lower_boundary = utils.rotate_points(upper_points_list=curves['upper'],
+                                                                         bottom_points_list=curves['lower'], N=1)
+            with profiler.stage('roughness'):
+                segment_size = metrics.segment_points(segment_length, axis_window, len(r_upper_boundary))
+                values['roughness'] = utils.calc_roughness(r_upper_boundary, segment_size)
+        if 'internalization' in stages:
+            with profiler.stage('internalization'):
+                widths = metrics.boundary_metrics(curves['upper'], curves['lower'], threshold=threshold)
+                values.update((name, widths[name]) for name in ('internalization', 'mean_width', 'width_variance'))
+        return values
+
+    try:
+        values = cache.cached(frame_cache, path, 'metrics', metric_params, compute_metrics)
+    except utils.NoBoundaryError as err:
+        logger.warning("skipping %s (time index %d): %s", path, num_it, err)
+        return None
+    return {name: float(value) for name, value in values.items()}
+
+def analysis_params(segment_length=metrics.DEFAULT_SEGMENT_LENGTH, axis_window=(0, 20, 8, 12), boundary_mode='geometry',
+                    threshold=metrics.DEFAULT_THRESHOLD, stages=STAGES, **options):
+    """
+    The stages and parameters of analyse_frame that determine the metrics it returns, recorded
+    with every frame in the results store so a resumed sweep recomputes the frames that were
+    analysed differently. Only the parameters of the stages that run are included; options
+    that do not change the metrics (cache, profiling, image output) are ignored.
+
+    return : dict : JSON serialisable parameters, including CACHE_VERSION
+    """
+    params = {'version': CACHE_VERSION, 'stages': sorted(stages)}
+    if set(stages) & {'sweep', 'roughness', 'internalization'}:
+        params.update(axis_window=[float(value) for value in axis_window], boundary_mode=boundary_mode)
+    if 'roughness' in stages:
+        params['segment_length'] = float(segment_length)
+    if 'internalization' in stages:
+        params['threshold'] = float(threshold)
+    return params
+
+def run_batch(file_pattern, store_path='results.nc', workers=None, chunksize=1, frame_range=(0, None),
+              resume=True, runs=None, prefetch=None, **frame_params):
+    """
+    Runs analyse_frame on every frame of every run matching file_pattern, spreading the frames
+    over a process pool. The frames of a run are the time slices of its files in order, so a
+    run may be a directory of single-frame files or a multi-timestep trajectory. Results are
+    gathered in frame order and appended to the results store (store.ResultsStore) as they
+    arrive, together with the analysis parameters of the frame (analysis_params). With resume
+    set, the frames that the store already holds from the same parameters are skipped; frames
+    computed with other parameters or an older CACHE_VERSION are analysed again.
+
+    With prefetch set, the frames are instead analysed in this process by a pipeline
+    (pipeline.run): an I/O thread reads up to prefetch frames ahead and writes the results and
+    images behind the computation, so reading, computing and writing overlap. This suits slow
+    (network) storage with few cpus.
+
+    With a profile_log in frame_params, the workers log their stages there and the store
+    writes are logged as the 'save' stage (with prefetch, the I/O thread also logs its frame
+    reads as 'read' and its image writes as 'save_image'); the log is restarted for the run
+    and a per-stage summary is printed at the end.
+
+    store_path : file of the results store
+    workers : number of worker processes (defaults to the number of cpus)
+    chunksize : number of frames handed to a worker at a time
+    frame_range : (start, stop) slice of the frames of each run to analyse
+    runs : ids of the runs to analyse (all runs matching the pattern if not given)
+    prefetch : number of frames read ahead by the pipeline (process pool if not given)
+    frame_params : keyword arguments passed on to analyse_frame
+    return : none
+    """
+    start = frame_range[0] or 0
+    if frame_params.get('image_dir') is not None:
+        os.makedirs(frame_params['image_dir'], exist_ok=True)
+    profile_log = frame_params.get('profile_log')
+    if profile_log is not None:
+        open(profile_log, 'w').close()
+    profiler = profiling.get_profiler(profile_log, frame_params.get('trace_memory', False))
+    params = analysis_params(**frame_params)
+    with store.ResultsStore(store_path) as results:
+        jobs = OrderedDict()
+        for run_id, paths in frames.discover_runs(file_pattern).items():
+            if runs is not None and run_id not in runs:
+                continue
+            todo = list(enumerate(frames.frame_sources(paths)[slice(*frame_range)], start))
+            if resume:
+                done = set(results.recorded_frames(run_id, params).tolist())
+                recorded = set(results.recorded_frames(run_id).tolist())
+                todo = [(frame, source) for frame, source in todo if frame not in done]
+                stale = sum(frame in recorded for frame, _ in todo)
+                if stale:
+                    print("pid {}: recomputing {} frames analysed with other stages or parameters"
+                          .format(run_id, stale))
+            if todo:
+                jobs[run_id] = todo
+
+        if prefetch:
+            run_pipelined(results, jobs, params, prefetch, frame_params)
+        else:
+            run_pool(results, jobs, params, workers, chunksize, profiler, frame_params)
+    if profile_log is not None:
+        print(profiling.format_summary(profiling.read_log(profile_log)))
+
+def run_pool(results, jobs, params, workers, chunksize, profiler, frame_params):
+    """
+    Analyses the frames of the jobs (run id -> list of (frame, (path, time index))) on a
+    process pool and appends the metrics to the results store in frame order, recorded as
+    computed with params; frames that analyse_frame skips are left out of the store
+
+    return : none
+    """
+    sources = [source for todo in jobs.values() for _, source in todo]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        stream = pool.map(partial(analyse_frame, **frame_params), *zip(*sources), chunksize=chunksize)
+        for run_id, todo in jobs.items():
+            for frame, _ in todo:
+                values = next(stream)
+                if values is None:
+                    continue
+                profiler.frame(run_id=run_id, frame=frame)
+                with profiler.stage('save'):
+                    results.append(run_id, frame, params, **values)
+            results.sync()
+            print("pid {} done".format(run_id))
+
+def run_pipelined(results, jobs, params, prefetch, frame_params):
+    """
+    Analyses the frames of the jobs (run id -> list of (frame, (path, time index))) in this
+    process with a read / compute / write pipeline; every netCDF read and write runs on its I/O
+    thread
+
+    return : none
+    """
+    items = [(run_id, frame, source, i == len(todo) - 1)
+             for run_id, todo in jobs.items() for i, (frame, source) in enumerate(todo)]
+    # the I/O thread labels its records apart from the frame being computed, so it gets its own
+    # profiler on the same log; tracemalloc peaks are process wide, so it does not trace memory
+    io_profiler = profiling.StageProfiler(frame_params.get('profile_log'))
+
+    def read(item):
+        run_id, frame, (path, num_it), _ = item
+        io_profiler.frame(run_id=run_id, frame=frame, path=path, num_it=num_it)
+        with io_profiler.stage('read'):
+            return read_frame(path, num_it)
+
+    def compute(item, raw):
+        images = []
+        values = analyse_frame(*item[2], raw=raw,
+                               image_sink=lambda filename, image: images.append((filename, image)), **frame_params)
+        return values, images
+
+    def write(item, output):
+        run_id, frame, _, last = item
+        values, images = output
+        io_profiler.frame(run_id=run_id, frame=frame)
+        for filename, image in images:
+            with io_profiler.stage('save_image'):
+                utils.write_image(filename, image)
+        if values is not None:
+            with io_profiler.stage('save'):
+                results.append(run_id, frame, params, **values)
+        if last:
+            results.sync()
+            print("pid {} done".format(run_id))
+
+    try:
+        pipeline.run(items, read, compute, write, prefetch=prefetch)
+    finally:
+        io_profiler.close()
+
+def plot_roughness(store_path, filename):
+    """
+    Plots the mean roughness over all runs in the results store against the frame number and
+    saves the figure to filename
+
+    return : numpy.ndarray : the mean roughness of each frame
+    """
+    with store.ResultsStore(store_path) as results:
+        roughness_plot = results.mean_over_runs('roughness')
+    num_frames = len(roughness_plot)
+
+    # drawn on its own Agg canvas, so batch never loads pyplot (in the workers neither)
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    fig.add_subplot().plot(np.linspace(1, num_frames, num_frames), roughness_plot, 'o')
+    fig.savefig(filename, bbox_inches='tight', pad_inches=0)
+    return roughness_plot
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch roughness analysis of vertex model runs")
+    parser.add_argument('pattern', nargs='?', default=DEFAULT_PATTERN, help="glob pattern of the nc frame files")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: cpu count)")
+    parser.add_argument('--chunksize', type=int, default=1, help="frames handed to a worker at a time")
+    parser.add_argument('--prefetch', type=int, default=None,
+                        help="analyse in this process, reading this many frames ahead on an I/O thread")
+    parser.add_argument('--frames', type=int, nargs=2, default=(0, None), metavar=('START', 'STOP'),
+                        help="range of frames of each run to analyse")
+    parser.add_argument('--segment-length', type=float, default=metrics.DEFAULT_SEGMENT_LENGTH,
+                        help="length (simulation units) of the segments the roughness is averaged over")
+    parser.add_argument('--threshold', type=float, default=metrics.DEFAULT_THRESHOLD,
+                        help="width (simulation units) at or below which the mesectoderm counts as internalized")
+    parser.add_argument('--axis-window', type=float, nargs=4, default=(0, 20, 8, 12),
+                        metavar=('X0', 'X1', 'Y0', 'Y1'))
+    parser.add_argument('--mode', choices=('geometry', 'image'), default='geometry',
+                        help="how the boundary curves are extracted")
+    parser.add_argument('--image-dir', default=None, help="directory for the rendered frame images")
+    parser.add_argument('--store', default='results.nc', help="results store file")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="recompute every frame, even those the store holds from the same stages and parameters")
+    parser.add_argument('--cache-dir', default=None, help="directory of the per-frame results cache")
+    parser.add_argument('--cache-size', type=float, default=1024, help="cache size limit in MB")
+    parser.add_argument('--profile', default=None, help="JSON lines file to log the time and memory of every stage to")
+    parser.add_argument('--trace-memory', action='store_true', help="also log Python allocations (tracemalloc)")
+    parser.add_argument('--plot', default='../roughness_graph_SLOW.png', help="mean roughness plot file")
+    args = parser.parse_args(argv)
+
+    run_batch(args.pattern, store_path=args.store, workers=args.workers, chunksize=args.chunksize,
+              frame_range=tuple(args.frames), resume=not args.no_resume, prefetch=args.prefetch,
+              segment_length=args.segment_length, threshold=args.threshold,
+              axis_window=tuple(args.axis_window), boundary_mode=args.mode, image_dir=args.image_dir,
+              cache_dir=args.cache_dir, cache_size=int(args.cache_size * 2**20), profile_log=args.profile,
+              trace_memory=args.trace_memory)
+    plot_roughness(args.store, args.plot)
+
+if __name__ == "__main__":
+    main()
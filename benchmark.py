@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from collections import OrderedDict
+
+import matplotlib
+matplotlib.use('Agg')
+import cv2
+import numpy as np
+
+import frames
+import synthetic
+import utils
+
+DEFAULT_SIZES = (16, 32, 64)
+TRAJECTORY_FRAMES = 8
+
+def make_fixture(size, directory, seed=0):
+    """
+    Builds the inputs of every benchmark for a size x size synthetic tiling: a perturbed frame,
+    its nc file, a multi-timestep trajectory (also written in the classic NETCDF3 format), the
+    rendered boundary image and the boundary curves
+
+    return : dict : the fixture
+    """
+    rng = np.random.default_rng(seed)
+    tiling = synthetic.hexagonal_tiling(size, size + size % 2)
+    frame = synthetic.perturb(tiling, rng=rng)
+    box_len = frame['BoxMatrix'][0]
+    axis_window = (0, box_len, 0.25 * box_len, 0.75 * box_len)
+
+    frame_path = os.path.join(directory, 'frame_{}.nc'.format(size))
+    synthetic.write_frames(frame_path, [frame])
+    trajectory_path = os.path.join(directory, 'trajectory_{}.nc'.format(size))
+    trajectory = [synthetic.perturb(tiling, rng=rng) for _ in range(TRAJECTORY_FRAMES)]
+    synthetic.write_frames(trajectory_path, trajectory)
+    classic_path = os.path.join(directory, 'trajectory_classic_{}.nc'.format(size))
+    synthetic.write_frames(classic_path, trajectory, format='NETCDF3_64BIT_OFFSET')
+
+    _, lines = utils.find_mesectoderm_boundary(len(frame['pos']), frame['Vneighs'], frame['VertexCellNeighbors'],
+                                               frame['cellType'], frame['pos'][:, 0], frame['pos'][:, 1])
+    image_path = os.path.join(directory, 'boundary_{}.png'.format(size))
+    utils.save_boundary_image(lines, box_len, image_path, axis_window)
+    upper, lower = utils.boundary_curves_from_lines(lines, box_len, axis_window)
+    return dict(frame, size=size, box_len=box_len, frame_path=frame_path, trajectory_path=trajectory_path,
+                classic_path=classic_path, image=cv2.imread(image_path), upper=upper, lower=lower,
+                rotated_upper=utils.rotate_points(upper, lower, N=1)[0])
+
+def bench_edges(fixture):
+    return lambda: utils.build_edge_segments(fixture['pos'], fixture['Vneighs'], fixture['BoxMatrix'], unique=True)
+
+def bench_boundary(fixture):
+    pos = fixture['pos']
+    return lambda: utils.find_mesectoderm_boundary(len(pos), fixture['Vneighs'], fixture['VertexCellNeighbors'],
+                                                   fixture['cellType'], pos[:, 0], pos[:, 1])
+
+def bench_sweeper(fixture):
+    return lambda: utils.sweeper(fixture['image'])
+
+def bench_rotate(fixture):
+    return lambda: utils.rotate_points(fixture['upper'], fixture['lower'], N=1)
+
+def bench_roughness(fixture):
+    segment_size = max(len(fixture['rotated_upper']) // 4, 2)
+    return lambda: utils.calc_roughness(fixture['rotated_upper'], segment_size)
+
+def bench_load_frame(fixture):
+    def load():
+        # a fresh loader every time, so the topology is decoded too
+        with utils.get_dataset(fixture['frame_path']) as ds:
+            return frames.FrameLoader(frames.DEFAULT_VARIABLES).load(ds, 0)
+    return load
+
+def bench_read_trajectory(fixture, key='trajectory_path'):
+    def read():
+        with frames.TrajectoryReader(fixture[key], frames.DEFAULT_VARIABLES) as reader:
+            for frame in reader.iter_frames():
+                pass
+    return read
+
+def bench_read_trajectory_classic(fixture):
+    return bench_read_trajectory(fixture, 'classic_path')
+
+BENCHMARKS = OrderedDict([('edges', bench_edges), ('boundary', bench_boundary), ('sweeper', bench_sweeper),
+                          ('rotate', bench_rotate), ('roughness', bench_roughness),
+                          ('load_frame', bench_load_frame), ('read_trajectory', bench_read_trajectory),
+                          ('read_trajectory_classic', bench_read_trajectory_classic)])
+
+def time_call(func, repeat=5, min_time=0.2):
+    """
+    Times func after one warm-up call. Every sample runs func enough times to last at least
+    min_time / repeat seconds
+
+    return : dict : 'best', 'median' and 'mean' seconds per call, and the number of 'calls' timed
+    """
+    func()
+    start = time.perf_counter()
+    func()
+    number = max(1, int(min_time / repeat / max(time.perf_counter() - start, 1e-9)))
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return {'best': min(samples), 'median': float(np.median(samples)), 'mean': float(np.mean(samples)),
+            'calls': number * repeat}
+
+def environment():
+    """return : dict : the machine, library versions and git commit the results were measured with"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'opencv': cv2.__version__, 'machine': platform.machine(), 'processor': platform.processor(),
+            'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def run_benchmarks(sizes=DEFAULT_SIZES, names=None, repeat=5, min_time=0.2):
+    """
+    Runs the benchmarks on synthetic tilings of each size
+
+    names : benchmarks to run (all of BENCHMARKS by default)
+    return : dict : 'environment' and 'results', mapping 'name[size]' to the timings
+    """
+    results = OrderedDict()
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            fixture = make_fixture(size, directory)
+            for name in names or BENCHMARKS:
+                key = '{}[{}]'.format(name, size)
+                results[key] = time_call(BENCHMARKS[name](fixture), repeat, min_time)
+                print("{:<28} {:10.3f} ms".format(key, results[key]['median'] * 1e3))
+    return {'environment': environment(), 'results': results}
+
+def compare(results, reference, tolerance=0.2):
+    """
+    Compares the median timings with those of a reference run
+
+    tolerance : relative slowdown above which a benchmark counts as a regression
+    return : list : (key, reference median, median) of every regression
+    """
+    regressions = []
+    for key, timing in results['results'].items():
+        if key not in reference['results']:
+            continue
+        ref_median = reference['results'][key]['median']
+        ratio = timing['median'] / ref_median
+        flag = '  REGRESSION' if ratio > 1 + tolerance else ''
+        print("{:<28} {:10.3f} ms -> {:10.3f} ms  x{:.2f}{}".format(key, ref_median * 1e3, timing['median'] * 1e3,
+                                                                   ratio, flag))
+        if flag:
+            regressions.append((key, ref_median, timing['median']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline on synthetic vertex model frames")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="cells per row of the tilings")
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=None, help="benchmarks to run")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds spent timing each benchmark")
+    parser.add_argument('--output', default='benchmark_results.json', help="file the results are saved to")
+    parser.add_argument('--compare', default=None, help="results file of a reference run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="relative slowdown reported as a regression")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.only, args.repeat, args.min_time)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print("results saved to {}".format(args.output))
+    if args.compare is not None:
+        with open(args.compare) as f:
+            reference = json.load(f)
+        regressions = compare(results, reference, args.tolerance)
+        if regressions:
+            print("{} regressions".format(len(regressions)))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
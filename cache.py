@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+def source_signature(path):
+    """
+    Identifies the current contents of a source file by its absolute path, size and
+    modification time
+
+    return : list : [path, size, mtime in ns]
+    """
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+class FrameCache(object):
+    """
+    On-disk cache of per-frame derived arrays (boundaries, roughness, ...), stored as one .npz
+    file per entry. An entry is keyed by the source file signature, the name of the analysis
+    stage and the stage parameters, so editing a source file or changing a parameter only
+    misses the entries that depend on it. Parameters must be JSON serialisable.
+
+    The cache holds at most max_bytes; when a new entry takes it over the limit, the least
+    recently used entries (by file modification time, which is refreshed on every hit) are
+    deleted.
+    """
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        """
+        return : list : (modification time, size, path) of every entry; entries deleted
+                 meanwhile by another process are skipped
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.npz'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def key(self, path, stage, params):
+        """return : str : the hex digest identifying the entry"""
+        blob = json.dumps([source_signature(path), stage, params], sort_keys=True)
+        return hashlib.sha1(blob.encode()).hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, path, stage, params):
+        """
+        return : dict : the cached arrays of the entry, or None if it is not cached
+        """
+        filename = self._filename(self.key(path, stage, params))
+        try:
+            with np.load(filename) as data:
+                arrays = {name: data[name] for name in data.files}
+            os.utime(filename)
+        except (OSError, ValueError):
+            return None
+        return arrays
+
+    def put(self, path, stage, params, arrays):
+        """
+        Stores a dictionary of arrays as the entry for (path, stage, params), then evicts the
+        least recently used entries if the cache is over its size limit
+
+        return : none
+        """
+        filename = self._filename(self.key(path, stage, params))
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+            size = f.tell()
+        os.replace(tmp_name, filename)
+        self.size += size
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache fits in max_bytes"""
+        entries = sorted(self._entries())
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+    def clear(self):
+        """Deletes every entry"""
+        for _, _, path in self._entries():
+            os.remove(path)
+        self.size = 0
+
+_open_caches = {}
+
+def open_cache(directory, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Returns the FrameCache for a directory, creating it on first use; each process keeps one
+    instance per directory so worker processes do not rescan the cache on every frame
+
+    return : FrameCache : the cache
+    """
+    frame_cache = _open_caches.get(directory)
+    if frame_cache is None or frame_cache.max_bytes != max_bytes:
+        frame_cache = _open_caches[directory] = FrameCache(directory, max_bytes)
+    return frame_cache
+
+def cached(frame_cache, path, stage, params, compute):
+    """
+    Returns the cached arrays of (path, stage, params), or computes them with compute() and
+    stores them. With no cache (frame_cache is None) this simply calls compute()
+
+    compute : function returning a dictionary of arrays
+    return : dict : the arrays of the entry
+    """
+    if frame_cache is None:
+        return compute()
+    arrays = frame_cache.get(path, stage, params)
+    if arrays is None:
+        arrays = compute()
+        frame_cache.put(path, stage, params, arrays)
+    return arrays
@@ -0,0 +1,379 @@
+import netCDF4 as nc
+import numpy as np
+import glob
+import math
+import os
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+def natural_key(text):
+    """
+    Key function for sorting strings naturally, i.e. with embedded numbers compared by value
+    ('p2' < 'p10')
+
+    return : list : the alternating text / integer chunks of the string
+    """
+    return [int(chunk) if chunk.isdigit() else chunk.lower() for chunk in re.split(r'(\d+)', text)]
+
+def parse_frame_name(path):
+    """
+    Splits an nc frame file name into its run id and timestep. The timestep is the last number
+    in the file name and the run id is everything before it, e.g.
+    'cellGPU_pid01_t00120.nc' -> ('cellGPU_pid01', 120) and 'test_p4.000.nc' -> ('test_p4', 0).
+    A name without any number is treated as timestep 0 of its own run.
+
+    return : (str, int) : the run id and timestep of the frame
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = re.search(r'(\d+)(?!.*\d)', stem)
+    if match is None:
+        return stem, 0
+    run_id = stem[:match.start()].rstrip('_-. ')
+    return run_id, int(match.group(1))
+
+def discover_runs(file_pattern):
+    """
+    Finds all nc frame files matching a glob pattern and groups them by run
+
+    return : collections.OrderedDict : run id -> list of file paths ordered by timestep, with
+             the runs in natural order of their ids
+    """
+    runs = {}
+    for path in glob.glob(file_pattern):
+        run_id, timestep = parse_frame_name(path)
+        runs.setdefault(run_id, []).append((timestep, path))
+    return OrderedDict((run_id, [path for _, path in sorted(runs[run_id])])
+                       for run_id in sorted(runs, key=natural_key))
+
+def frame_sources(paths):
+    """
+    Lists every time slice of the given nc files, in order; works for single-frame files as
+    well as multi-timestep trajectories
+
+    return : list : (path, time index) pairs
+    """
+    sources = []
+    for path in paths:
+        with nc.Dataset(path) as ds:
+            num_steps = ds.dimensions['time'].size if 'time' in ds.dimensions else 1
+        sources.extend((path, num_it) for num_it in range(num_steps))
+    return sources
+
+class DatasetPool(object):
+    """A small LRU pool of open netCDF4.Dataset handles, closing the least recently used one
+    when more than max_open files are open."""
+    def __init__(self, max_open=8):
+        self.max_open = max_open
+        self.handles = OrderedDict()
+
+    def get(self, path):
+        ds = self.handles.get(path)
+        if ds is not None:
+            self.handles.move_to_end(path)
+            return ds
+        ds = nc.Dataset(path)
+        self.handles[path] = ds
+        while len(self.handles) > self.max_open:
+            self.handles.popitem(last=False)[1].close()
+        return ds
+
+    def close(self):
+        while self.handles:
+            self.handles.popitem()[1].close()
+
+class FrameSequence(object):
+    """
+    Lazy sequence of the nc frame files matching a glob pattern, ordered naturally by run id
+    and then by timestep. Files are only opened when a frame is accessed, through a shared LRU
+    pool of at most max_open handles, so a dataset returned by the sequence may be closed again
+    after max_open other frames have been accessed. Use open() for a handle whose lifetime you
+    control.
+
+    Indexing:
+        seq[i]              -> netCDF4.Dataset of the i-th frame overall
+        seq[pid, i]         -> netCDF4.Dataset of the i-th frame of run pid
+        seq[i:j], seq[pid], seq[pid, i:j]
+                            -> FrameSequence view over those frames (sharing the pool)
+    pid is either a run id or the position of the run in the sequence.
+    """
+    def __init__(self, file_pattern=None, max_open=8, runs=None, pool=None, loader=None):
+        self.runs = runs if runs is not None else discover_runs(file_pattern)
+        self.paths = [path for paths in self.runs.values() for path in paths]
+        self.pool = pool if pool is not None else DatasetPool(max_open)
+        self.loader = loader if loader is not None else FrameLoader()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        for path in self.paths:
+            yield self.pool.get(path)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            pid, index = key
+            return self.run(pid)[index]
+        if isinstance(key, slice):
+            return self._view(self.paths[key])
+        if isinstance(key, str):
+            return self.run(key)
+        return self.pool.get(self.paths[key])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _view(self, paths):
+        wanted = set(paths)
+        runs = OrderedDict()
+        for run_id, run_paths in self.runs.items():
+            kept = [path for path in run_paths if path in wanted]
+            if kept:
+                runs[run_id] = kept
+        return FrameSequence(runs=runs, pool=self.pool, loader=self.loader)
+
+    def run_ids(self):
+        """return : list : the run ids in order"""
+        return list(self.runs)
+
+    def run(self, pid):
+        """
+        return : FrameSequence : view over the frames of a single run, given its run id or its
+                 position in the sequence
+        """
+        run_id = pid if isinstance(pid, str) else self.run_ids()[pid]
+        return FrameSequence(runs=OrderedDict([(run_id, self.runs[run_id])]), pool=self.pool, loader=self.loader)
+
+    def open(self, index):
+        """
+        Opens a frame outside the pool; the caller is responsible for closing it (it can be
+        used as a context manager)
+
+        return : netCDF4.Dataset : the frame data
+        """
+        return nc.Dataset(self.paths[index])
+
+    def frame(self, index, num_it=0):
+        """
+        return : Frame : the decoded time slice num_it of the index-th frame file, read through
+                 the sequence's FrameLoader
+        """
+        return self.loader.load(self.pool.get(self.paths[index]), num_it)
+
+    def iter_frames(self):
+        """Iterates over the decoded frames (see frame) in order"""
+        for index in range(len(self.paths)):
+            yield self.frame(index)
+
+    def items(self):
+        """
+        Iterates over (path, dataset) pairs in order, like the dictionary previously returned
+        by utils.read_files
+        """
+        for path in self.paths:
+            yield path, self.pool.get(path)
+
+    def close(self):
+        """Closes every handle in the pool"""
+        self.pool.close()
+
+DEFAULT_CHUNK_FRAMES = 16
+
+TOPOLOGY_VARIABLES = ('Vneighs', 'VertexCellNeighbors', 'cellVer', 'cellVerNum', 'cellType')
+DEFAULT_VARIABLES = ('pos', 'Vneighs', 'VertexCellNeighbors', 'cellType', 'BoxMatrix')
+
+def decode_variable(name, raw):
+    """
+    Decodes the raw time slice of a frame variable into the array layout used by the analysis:
+    interleaved positions become (N, 2) float arrays, neighbour lists (Nv, 3) index arrays and
+    cellVer the padded (Nc, 16) index array (-1 marks unused slots)
+
+    return : numpy.ndarray : the decoded variable
+    """
+    if name in ('pos', 'cellPositions'):
+        return np.asarray(raw, dtype=float).reshape(-1, 2)
+    if name in ('Vneighs', 'VertexCellNeighbors'):
+        return np.asarray(raw).astype(np.intp).reshape(-1, 3)
+    if name == 'cellVer':
+        return np.asarray(raw).astype(np.intp).reshape(-1, 16)
+    if name in ('cellVerNum', 'cellType'):
+        return np.asarray(raw).astype(np.intp).reshape(-1)
+    return np.asarray(raw)
+
+class Frame(object):
+    """
+    The decoded variables of one time slice of a dataset, indexed by variable name.
+
+    topology_changed : whether any topology variable differs from the previously loaded frame
+    """
+    def __init__(self, num_it, variables, topology_changed, num_v=None, num_cell=None):
+        self.num_it = num_it
+        self.variables = variables
+        self.topology_changed = topology_changed
+        self.num_v = num_v
+        self.num_cell = num_cell
+
+    def __getitem__(self, name):
+        return self.variables[name]
+
+    def __contains__(self, name):
+        return name in self.variables
+
+class FrameLoader(object):
+    """
+    Loads single frames from datasets, reading only the requested time slice of the requested
+    variables. The topology variables (TOPOLOGY_VARIABLES) of the last frame are kept, and when a
+    new frame's raw topology is identical the already decoded arrays are reused instead of being
+    decoded again.
+    """
+    def __init__(self, variables=DEFAULT_VARIABLES):
+        self.variables = tuple(variables)
+        self.topology = {}      # name -> (raw slice, decoded array)
+
+    def load(self, ds, num_it=0, variables=None):
+        """
+        ds : netCDF4.Dataset to read from
+        num_it : index of the time slice to read
+        variables : variables to read (defaults to the loader's variables)
+        return : Frame : the decoded frame
+        """
+        raw, num_v, num_cell = self.read(ds, num_it, variables)
+        return self.decode(raw, num_it, num_v=num_v, num_cell=num_cell)
+
+    def read(self, ds, num_it=0, variables=None):
+        """
+        Reads the raw time slices of a frame without decoding them
+
+        return : dict, int, int : variable name -> raw time slice, and the number of vertices
+                 and cells (None if the dataset does not have the dimension)
+        """
+        ds.set_auto_mask(False)
+        raw = {name: ds.variables[name][num_it] for name in (variables or self.variables)}
+        dims = ds.dimensions
+        return raw, dims['Nv'].size if 'Nv' in dims else None, dims['Nc'].size if 'Nc' in dims else None
+
+    def decode(self, raw, num_it=0, num_v=None, num_cell=None):
+        """
+        Decodes raw time slices that have already been read
+
+        raw : dictionary of variable name -> raw time slice
+        return : Frame : the decoded frame
+        """
+        data = {}
+        topology_changed = False
+        for name, raw_slice in raw.items():
+            if name in TOPOLOGY_VARIABLES:
+                cached = self.topology.get(name)
+                if cached is not None and np.array_equal(cached[0], raw_slice):
+                    data[name] = cached[1]
+                    continue
+                topology_changed = True
+                # copied, so a slice of a larger block read does not keep the whole block alive
+                raw_slice = np.array(raw_slice)
+                self.topology[name] = (raw_slice, decode_variable(name, raw_slice))
+                data[name] = self.topology[name][1]
+            else:
+                data[name] = decode_variable(name, raw_slice)
+        return Frame(num_it, data, topology_changed, num_v=num_v, num_cell=num_cell)
+
+class TrajectoryReader(object):
+    """
+    Streams the frames of a single multi-timestep nc file. The time dimension is read in blocks
+    of chunk_size frames, aligned to the file's NetCDF chunking along time, and while one block
+    is being used the next one is read on a background thread. At most the current and the
+    prefetched block are held in memory, however long the trajectory is.
+
+    Offers the same per-frame interface as FrameSequence: len(), frame(index) and
+    iter_frames(), which return decoded Frame objects.
+
+    variables : variables to read
+    chunk_size : frames per block; rounded up to a multiple of the file's time chunking
+                 (defaults to the smallest such multiple of at least DEFAULT_CHUNK_FRAMES)
+    prefetch : whether to read the next block ahead on the background thread
+    """
+    def __init__(self, path, variables=DEFAULT_VARIABLES, chunk_size=None, prefetch=True):
+        self.ds = nc.Dataset(path)
+        self.ds.set_auto_mask(False)
+        self.loader = FrameLoader(variables)
+        self.num_steps = self.ds.dimensions['time'].size
+        self.timed = [name for name in self.loader.variables if self.ds.variables[name].dimensions[:1] == ('time',)]
+        self.static = {name: self.ds.variables[name][:] for name in self.loader.variables if name not in self.timed}
+        storage = self.storage_chunk_size()
+        wanted = chunk_size or max(DEFAULT_CHUNK_FRAMES, storage)
+        self.chunk_size = -(-wanted // storage) * storage
+        self.prefetch = prefetch
+        # every read of the dataset goes through this single thread
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.current = None
+        self.pending = None
+        dims = self.ds.dimensions
+        self.num_v = dims['Nv'].size if 'Nv' in dims else None
+        self.num_cell = dims['Nc'].size if 'Nc' in dims else None
+
+    def __len__(self):
+        return self.num_steps
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def storage_chunk_size(self):
+        """
+        return : int : the number of frames per storage chunk along time that is a multiple of
+                 the chunking of every variable read (1 for contiguous variables and for classic
+                 NETCDF3 files, whose variables have no chunking)
+        """
+        size = 1
+        for name in self.timed:
+            chunking = self.ds.variables[name].chunking()
+            if chunking is not None and chunking != 'contiguous':
+                size = math.lcm(size, int(chunking[0]))
+        return size
+
+    def _read_block(self, start):
+        stop = min(start + self.chunk_size, self.num_steps)
+        return start, {name: self.ds.variables[name][start:stop] for name in self.timed}
+
+    def _block(self, start):
+        if self.pending is not None and self.pending[0] == start:
+            block = self.pending[1].result()
+        else:
+            block = self.executor.submit(self._read_block, start).result()
+        self.pending = None
+        following = start + self.chunk_size
+        if self.prefetch and following < self.num_steps:
+            self.pending = (following, self.executor.submit(self._read_block, following))
+        return block
+
+    def frame(self, index):
+        """
+        return : Frame : the decoded frame at time index
+        """
+        if index < 0:
+            index += self.num_steps
+        if not 0 <= index < self.num_steps:
+            raise IndexError("frame {} out of range for {} timesteps".format(index, self.num_steps))
+        start = index - index % self.chunk_size
+        if self.current is None or self.current[0] != start:
+            self.current = None
+            self.current = self._block(start)
+        block = self.current[1]
+        raw = {name: block[name][index - start] for name in self.timed}
+        raw.update(self.static)
+        return self.loader.decode(raw, index, num_v=self.num_v, num_cell=self.num_cell)
+
+    def iter_frames(self):
+        """Iterates over the decoded frames in time order"""
+        for index in range(self.num_steps):
+            yield self.frame(index)
+
+    def close(self):
+        """Waits for any pending read and closes the file"""
+        self.executor.shutdown(wait=True)
+        self.current = self.pending = None
+        self.ds.close()
@@ -0,0 +1,84 @@
+import numpy as np
+
+import render
+
+DEFAULT_AXIS_WINDOW = (0, 20, 8, 12)
+
+# widths at or below this count as internalized: 3 pixels of the default boundary image
+# (the threshold calc_mes_internalization used), in simulation units
+DEFAULT_THRESHOLD = 3 * (DEFAULT_AXIS_WINDOW[3] - DEFAULT_AXIS_WINDOW[2]) / render.DEFAULT_SIZE[1]
+
+# roughness segment length: the 150 columns of the default boundary image the roughness was
+# computed over, in simulation units
+DEFAULT_SEGMENT_LENGTH = 150 * (DEFAULT_AXIS_WINDOW[1] - DEFAULT_AXIS_WINDOW[0]) / render.DEFAULT_SIZE[0]
+
+def pixel_scale(axis_window=DEFAULT_AXIS_WINDOW, image_size=render.DEFAULT_SIZE):
+    """
+    return : numpy.ndarray : [x, y] simulation units per pixel of a boundary image of
+             image_size (width, height) pixels showing the axis window
+    """
+    x0, x1, y0, y1 = axis_window
+    return np.array([(x1 - x0) / image_size[0], (y1 - y0) / image_size[1]], dtype=float)
+
+def pixels_to_coords(points, axis_window=DEFAULT_AXIS_WINDOW, image_size=render.DEFAULT_SIZE):
+    """
+    Converts [column, row] pixel points of a boundary image showing the axis window (as from
+    sweeper) to [x, y] simulation coordinates of the pixel centres, with y pointing up
+
+    return : numpy.ndarray : the points in simulation coordinates
+    """
+    points = np.asarray(points, dtype=float)
+    scale = pixel_scale(axis_window, image_size)
+    x = axis_window[0] + (points[..., 0] + 0.5) * scale[0]
+    y = axis_window[3] - (points[..., 1] + 0.5) * scale[1]
+    return np.stack([x, y], axis=-1)
+
+def segment_points(segment_length, axis_window, num_points):
+    """
+    return : int : the number of points of a boundary curve sampled at num_points evenly spaced
+             x positions across the axis window that span segment_length (at least 1)
+    """
+    spacing = (axis_window[1] - axis_window[0]) / num_points
+    return max(int(round(segment_length / spacing)), 1)
+
+def width_profile(upper, lower, scale=1.0):
+    """
+    Width of the mesectoderm at every column: the distance between the upper and lower
+    boundary curves, in physical units
+
+    upper, lower : (W, 2) curves of [x, y] points (as from sweeper or
+                   boundary_curves_from_lines), or (F, W, 2) stacks of frames
+    scale : physical units per unit of the curves' y coordinates (see pixel_scale; 1 for
+            curves already in simulation units)
+    return : numpy.ndarray : (W,) or (F, W) widths
+    """
+    upper = np.asarray(upper, dtype=float)
+    lower = np.asarray(lower, dtype=float)
+    return np.abs(upper[..., 1] - lower[..., 1]) * scale
+
+def internalization(widths, threshold=DEFAULT_THRESHOLD):
+    """
+    Fraction of the columns where the mesectoderm has closed up to at most threshold wide
+
+    widths : (W,) or (F, W) width profiles (see width_profile)
+    return : float or numpy.ndarray : the fraction of each frame
+    """
+    return np.mean(np.asarray(widths) <= threshold, axis=-1)
+
+def width_stats(widths):
+    """
+    return : dict : 'mean_width' and 'width_variance' of each width profile ((F,) arrays for
+             an (F, W) stack)
+    """
+    widths = np.asarray(widths, dtype=float)
+    return {'mean_width': widths.mean(axis=-1), 'width_variance': widths.var(axis=-1)}
+
+def boundary_metrics(upper, lower, scale=1.0, threshold=DEFAULT_THRESHOLD):
+    """
+    Computes the width metrics of one frame or of a whole (F, W, 2) stack of frames in one call
+
+    return : dict : the 'width' profiles, and the 'internalization', 'mean_width' and
+             'width_variance' of each frame
+    """
+    widths = width_profile(upper, lower, scale)
+    return dict(width_stats(widths), width=widths, internalization=internalization(widths, threshold))
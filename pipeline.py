@@ -0,0 +1,105 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+class Prefetcher(object):
+    """
+    Iterates over the results of read(item) for every item, in order, while keeping up to
+    depth reads queued or running on an I/O executor (a single thread of its own by default).
+    The reads run ahead of the consumer by at most depth items, so memory stays bounded
+    however slow the consumer is.
+    """
+    def __init__(self, items, read, depth=4, executor=None):
+        self.items = iter(items)
+        self.read = read
+        self.depth = max(depth, 1)
+        self.own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.pending = deque()
+
+    def _fill(self):
+        while len(self.pending) < self.depth:
+            try:
+                item = next(self.items)
+            except StopIteration:
+                return
+            self.pending.append((item, self.executor.submit(self.read, item)))
+
+    def __iter__(self):
+        try:
+            self._fill()
+            while self.pending:
+                item, future = self.pending.popleft()
+                self._fill()
+                yield item, future.result()
+        finally:
+            self.close()
+
+    def close(self):
+        for _, future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        if self.own_executor:
+            self.executor.shutdown(wait=True)
+
+class AsyncWriter(object):
+    """
+    Runs write calls in submission order on an I/O executor (a single thread of its own by
+    default), with at most max_pending calls outstanding: submit() waits for the oldest call
+    when the limit is reached (backpressure), so a slow disk slows the producer down instead
+    of letting results pile up in memory. An error raised by a write call is re-raised by
+    submit() or close().
+    """
+    def __init__(self, max_pending=8, executor=None):
+        self.max_pending = max(max_pending, 1)
+        self.own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.pending = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(wait=exc_type is None)
+
+    def submit(self, func, *args, **kwargs):
+        """Queues func(*args, **kwargs), waiting while max_pending calls are outstanding"""
+        while self.pending and (len(self.pending) >= self.max_pending or self.pending[0].done()):
+            self.pending.popleft().result()
+        self.pending.append(self.executor.submit(func, *args, **kwargs))
+
+    def close(self, wait=True):
+        """Waits for the queued calls to finish (or cancels them if not wait)"""
+        try:
+            while self.pending:
+                future = self.pending.popleft()
+                if wait:
+                    future.result()
+                else:
+                    future.cancel()
+        finally:
+            if self.own_executor:
+                self.executor.shutdown(wait=True)
+
+def run(items, read, compute, write, prefetch=4, max_pending_writes=8):
+    """
+    Runs a three stage pipeline over items: read(item), prefetched up to prefetch items ahead,
+    compute(item, data) on the calling thread, and write(item, result) in item order. The
+    stages are connected by bounded queues, so they overlap and the throughput is that of the
+    slowest stage rather than of the sum of the stages.
+
+    Reads and writes share one I/O thread: the netCDF library is not thread safe, so every
+    netCDF call of the pipeline must come from the same thread. Computing still overlaps with
+    the I/O.
+
+    write : function called with each result, or None if compute does its own output
+    return : int : the number of items processed
+    """
+    count = 0
+    with ThreadPoolExecutor(max_workers=1) as io_executor:
+        with AsyncWriter(max_pending_writes, io_executor) as writer:
+            for item, data in Prefetcher(items, read, prefetch, io_executor):
+                result = compute(item, data)
+                if write is not None:
+                    writer.submit(write, item, result)
+                count += 1
+    return count
@@ -0,0 +1,195 @@
+import json
+import os
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PERCENTILES = (50, 90, 99)
+
+def current_rss():
+    """
+    return : int : resident set size of this process in bytes (from psutil if it is installed,
+             else /proc on Linux), or 0 if it cannot be read
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+class _NullStage(object):
+    """Context manager of a disabled profiler: does nothing"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage(object):
+    """Measures one stage of one frame and hands the record to the profiler on exit"""
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.trace_memory:
+            tracemalloc.reset_peak()
+            self.traced = tracemalloc.get_traced_memory()[0]
+        self.rss = current_rss()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        rss = current_rss()
+        record = OrderedDict(self.profiler.labels)
+        record.update(stage=self.name, wall=wall, cpu=cpu, rss=rss, rss_delta=rss - self.rss)
+        if self.profiler.trace_memory:
+            traced, peak = tracemalloc.get_traced_memory()
+            record.update(py_delta=traced - self.traced, py_peak=peak - self.traced)
+        if exc[0] is not None:
+            record['error'] = exc[0].__name__
+        self.profiler.write(record)
+        return False
+
+class StageProfiler(object):
+    """
+    Records the wall time, CPU time and resident memory change (and, with trace_memory, the
+    Python allocations from tracemalloc) of every stage of every frame, as one JSON line per
+    stage appended to log_path. Every record also holds the absolute RSS, so memory that keeps
+    growing from frame to frame (a leak) shows up directly in the log.
+
+    Several processes can share a log: each record is written with a single append.
+
+    Without a log_path the profiler is disabled and stage() returns a shared no-op context
+    manager, so instrumented code costs one method call per stage.
+
+        profiler.frame(path=path, num_it=0)
+        with profiler.stage('boundary'):
+            ...
+    """
+    def __init__(self, log_path=None, trace_memory=False):
+        self.log_path = log_path
+        self.enabled = log_path is not None
+        self.trace_memory = trace_memory and self.enabled
+        self.labels = OrderedDict()
+        self.fd = None
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def frame(self, **labels):
+        """Sets the labels (run, file, frame number, ...) stored with the following records"""
+        if self.enabled:
+            self.labels = OrderedDict(labels, process=os.getpid())
+
+    def stage(self, name):
+        """return : context manager : measures the enclosed block as stage name"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def write(self, record):
+        if self.fd is None:
+            self.fd = os.open(self.log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.write(self.fd, (json.dumps(record) + '\n').encode())
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+DISABLED = StageProfiler()
+
+_profilers = {}
+
+def get_profiler(log_path=None, trace_memory=False):
+    """
+    Returns the profiler writing to log_path, creating it on first use; each process keeps one
+    instance per log so worker processes open the log once. Without a log_path this is the
+    disabled profiler
+
+    return : StageProfiler : the profiler
+    """
+    if log_path is None:
+        return DISABLED
+    key = (os.path.abspath(log_path), bool(trace_memory))
+    if key not in _profilers:
+        _profilers[key] = StageProfiler(log_path, trace_memory)
+    return _profilers[key]
+
+def read_log(log_path):
+    """return : list : the records of a profiling log"""
+    with open(log_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def summarize(records):
+    """
+    Aggregates profiling records per stage
+
+    return : OrderedDict : stage -> dict with the record 'count', the 'wall' time
+             percentiles and maximum, the 'cpu' mean, the mean and maximum 'rss_delta' and, if
+             traced, the mean 'py_delta' and maximum 'py_peak' (stages in order of appearance)
+    """
+    stages = OrderedDict()
+    for record in records:
+        stages.setdefault(record['stage'], []).append(record)
+    summary = OrderedDict()
+    for stage, stage_records in stages.items():
+        column = lambda name: np.array([record[name] for record in stage_records if name in record], dtype=float)
+        wall, rss_delta = column('wall'), column('rss_delta')
+        summary[stage] = OrderedDict([('count', len(stage_records)),
+                                      ('wall_total', wall.sum()), ('wall_max', wall.max()),
+                                      ('cpu_mean', column('cpu').mean()),
+                                      ('rss_delta_mean', rss_delta.mean()), ('rss_delta_max', rss_delta.max())])
+        for q, value in zip(PERCENTILES, np.percentile(wall, PERCENTILES)):
+            summary[stage]['wall_p{}'.format(q)] = value
+        py_delta, py_peak = column('py_delta'), column('py_peak')
+        if len(py_delta):
+            summary[stage].update(py_delta_mean=py_delta.mean(), py_peak_max=py_peak.max())
+    return summary
+
+def rss_growth(records):
+    """
+    return : dict : process id -> (first, last) RSS in bytes over its records, in log order
+    """
+    growth = OrderedDict()
+    for record in records:
+        first = growth.get(record.get('process'), (record['rss'],))[0]
+        growth[record.get('process')] = (first, record['rss'])
+    return growth
+
+def format_summary(records):
+    """return : str : a table of the per-stage summary of the records and the RSS growth of every process"""
+    summary = summarize(records)
+    header = ['stage', 'count'] + ['p{} ms'.format(q) for q in PERCENTILES] + ['max ms', 'cpu ms', 'rss MB', 'max rss MB']
+    traced = any('py_delta_mean' in stats for stats in summary.values())
+    if traced:
+        header += ['py MB', 'py peak MB']
+    rows = []
+    for stage, stats in summary.items():
+        row = [stage, str(stats['count'])]
+        row += ['{:.2f}'.format(stats['wall_p{}'.format(q)] * 1e3) for q in PERCENTILES]
+        row += ['{:.2f}'.format(stats['wall_max'] * 1e3), '{:.2f}'.format(stats['cpu_mean'] * 1e3),
+                '{:.2f}'.format(stats['rss_delta_mean'] / 2**20), '{:.2f}'.format(stats['rss_delta_max'] / 2**20)]
+        if traced:
+            row += ['{:.2f}'.format(stats.get('py_delta_mean', np.nan) / 2**20),
+                    '{:.2f}'.format(stats.get('py_peak_max', np.nan) / 2**20)]
+        rows.append(row)
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    lines = ['  '.join(cell.rjust(width) for cell, width in zip(row, widths)) for row in [header] + rows]
+    for pid, (first, last) in rss_growth(records).items():
+        lines.append("process {}: rss {:.1f} MB -> {:.1f} MB".format(pid, first / 2**20, last / 2**20))
+    return '\n'.join(lines)
@@ -0,0 +1,63 @@
+import numpy as np
+from matplotlib import colors
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+# size of the images save_boundary_image used to write through pyplot (the axes area of a
+# default 6.4 x 4.8 inch, 100 dpi figure), so sweeper's pixel units stay the same
+DEFAULT_SIZE = (496, 369)
+
+class LineCanvas(object):
+    """
+    Renders line segments to an in-memory image with a matplotlib figure drawn straight on an
+    Agg canvas (no pyplot, so no global figure manager that keeps figures alive). The figure,
+    its axes and a single LineCollection are created once and reused: rendering a frame only
+    swaps the collection's segments and redraws the canvas.
+
+    size : (width, height) of the images in pixels
+    axis_window : [x0, x1, y0, y1] region of the simulation box shown
+    colour : matplotlib colour of the lines
+    """
+    def __init__(self, size=DEFAULT_SIZE, axis_window=(0, 20, 8, 12), colour='tab:green', line_width=1, dpi=100):
+        self.size = tuple(size)
+        self.figure = Figure(figsize=(self.size[0] / dpi, self.size[1] / dpi), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_axes([0, 0, 1, 1])
+        self.ax.set_axis_off()
+        self.lines = LineCollection([], linewidths=line_width, colors=colors.to_rgba(colour))
+        self.ax.add_collection(self.lines)
+        self.set_window(axis_window)
+
+    def set_window(self, axis_window):
+        """Sets the region of the simulation box shown"""
+        self.axis_window = tuple(axis_window)
+        self.ax.set_xlim(self.axis_window[0], self.axis_window[1])
+        self.ax.set_ylim(self.axis_window[2], self.axis_window[3])
+
+    def render(self, segments):
+        """
+        segments : (E, 2, 2) line segments in simulation coordinates (already split at the
+                   periodic boundary, see utils.periodic_segments)
+        return : numpy.ndarray : (height, width, 3) uint8 BGR image, as cv2.imread would load it
+        """
+        self.lines.set_segments(segments)
+        self.canvas.draw()
+        return np.asarray(self.canvas.buffer_rgba())[:, :, 2::-1].copy()
+
+_canvases = {}
+
+def get_canvas(size=DEFAULT_SIZE, axis_window=(0, 20, 8, 12), colour='tab:green', line_width=1):
+    """
+    Returns this process's canvas with the given style, creating it on first use, and sets its
+    axis window; workers thus render every frame on the same figure
+
+    return : LineCanvas : the canvas
+    """
+    key = (tuple(size), colour, line_width)
+    canvas = _canvases.get(key)
+    if canvas is None:
+        canvas = _canvases[key] = LineCanvas(size, axis_window, colour, line_width)
+    elif canvas.axis_window != tuple(axis_window):
+        canvas.set_window(axis_window)
+    return canvas
@@ -0,0 +1,162 @@
+import numpy as np
+
+import utils
+
+class PeriodicGrid(object):
+    """
+    Uniform cell-list grid over points (vertices or cell centres) in a periodic box, built in
+    one vectorized pass per frame: the points are binned and sorted by bin, so the points of
+    any bin are a contiguous slice of order. Box, radius and k-nearest queries then only look
+    at the bins overlapping the query region, with distances measured under the minimum image
+    convention.
+
+    points : (N, 2) positions, e.g. frame['pos'] or frame['cellPositions']
+    box_matrix : BoxMatrix of the frame, or the [Lx, Ly] box lengths
+    points_per_bin : average number of points per bin the grid is sized for
+    """
+    def __init__(self, points, box_matrix, points_per_bin=2.0):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.box = np.asarray(utils.get_box_lengths(box_matrix), dtype=float)
+        num_points = len(self.points)
+        bin_len = np.sqrt(self.box.prod() * points_per_bin / max(num_points, 1))
+        self.num_bins = np.maximum((self.box // bin_len).astype(int), 1)
+        self.bin_len = self.box / self.num_bins
+
+        bin_xy = self.bin_of(self.points)
+        flat = bin_xy[:, 0] * self.num_bins[1] + bin_xy[:, 1]
+        self.order = np.argsort(flat, kind='stable')
+        self.counts = np.bincount(flat, minlength=self.num_bins.prod())
+        self.starts = np.cumsum(self.counts) - self.counts
+
+    def __len__(self):
+        return len(self.points)
+
+    def bin_of(self, coords):
+        """return : numpy.ndarray : (M, 2) integer bin coordinates of the (wrapped) coordinates"""
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        return (np.floor(coords / self.bin_len).astype(int)) % self.num_bins
+
+    def displacement(self, coords, indices):
+        """return : numpy.ndarray : minimum image vectors from coords to the points at indices"""
+        delta = self.points[indices] - coords
+        return delta - self.box * np.round(delta / self.box)
+
+    def _gather(self, bins):
+        """
+        Lists the points of several bins per query
+
+        bins : (M, B) flat bin indices per query
+        return : numpy.ndarray, numpy.ndarray : the query of every candidate and the candidate
+                 point indices, grouped by query
+        """
+        counts = self.counts[bins]
+        per_query = counts.sum(axis=1)
+        counts = counts.reshape(-1)
+        # ragged arange: the slice starts[b] .. starts[b] + counts[b] of every bin, concatenated
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        slots = np.repeat(self.starts[bins].reshape(-1), counts) + offsets
+        return np.repeat(np.arange(len(bins)), per_query), self.order[slots]
+
+    def _ring_bins(self, bin_xy, ring):
+        """return : numpy.ndarray : (M, B) flat indices of the bins within ring bins of each query's bin"""
+        axes = []
+        for axis in (0, 1):
+            if 2 * ring + 1 >= self.num_bins[axis]:
+                # the ring wraps all the way around: every bin of the axis, once
+                axes.append(np.arange(self.num_bins[axis])[None, :])
+            else:
+                axes.append(bin_xy[:, axis:axis + 1] + np.arange(-ring, ring + 1))
+        flat = (axes[0] % self.num_bins[0])[:, :, None] * self.num_bins[1] + (axes[1] % self.num_bins[1])[:, None, :]
+        return np.broadcast_to(flat, (len(bin_xy),) + flat.shape[1:]).reshape(len(bin_xy), -1)
+
+    def query_box(self, axis_window):
+        """
+        Finds the points inside a rectangle, which may extend past the box edges (it is wrapped)
+
+        axis_window : [x0, x1, y0, y1] region of the simulation box
+        return : numpy.ndarray : sorted indices of the points inside
+        """
+        x0, x1, y0, y1 = axis_window
+        low, high = np.array([x0, y0], dtype=float), np.array([x1, y1], dtype=float)
+        ranges = []
+        for axis in (0, 1):
+            first = int(np.floor(low[axis] / self.bin_len[axis]))
+            last = int(np.floor(high[axis] / self.bin_len[axis]))
+            if last - first + 1 >= self.num_bins[axis]:
+                ranges.append(np.arange(self.num_bins[axis]))
+            else:
+                ranges.append(np.arange(first, last + 1) % self.num_bins[axis])
+        bins = (ranges[0][:, None] * self.num_bins[1] + ranges[1][None, :]).reshape(1, -1)
+        _, candidates = self._gather(bins)
+        # offset from the window's low corner, wrapped into [0, L)
+        offset = (self.points[candidates] - low) % self.box
+        inside = (offset <= np.minimum(high - low, self.box)).all(axis=1)
+        return np.sort(candidates[inside])
+
+    def query_radius(self, coords, radius):
+        """
+        Finds the points within radius of each query position
+
+        coords : (M, 2) or (2,) query positions
+        return : list : one sorted index array per query (a single array for a (2,) query)
+        """
+        coords = np.asarray(coords, dtype=float)
+        single = coords.ndim == 1
+        coords = coords.reshape(-1, 2)
+        ring = int(np.ceil(radius / self.bin_len.min()))
+        queries, candidates = self._gather(self._ring_bins(self.bin_of(coords), ring))
+        delta = self.displacement(coords[queries], candidates)
+        within = np.einsum('ij,ij->i', delta, delta) <= radius ** 2
+        queries, candidates = queries[within], candidates[within]
+        sort = np.lexsort((candidates, queries))
+        found = np.split(candidates[sort], np.cumsum(np.bincount(queries, minlength=len(coords)))[:-1])
+        return found[0] if single else found
+
+    def query_knn(self, coords, k=1):
+        """
+        Finds the k nearest points of each query position. The search starts with the bins
+        around each query and widens, for the queries that need it, until the k-th nearest
+        candidate is provably closer than any point outside the searched bins.
+
+        coords : (M, 2) query positions
+        return : numpy.ndarray, numpy.ndarray : (M, k) distances and point indices, nearest first
+        """
+        if not 1 <= k <= len(self.points):
+            raise ValueError("k must be between 1 and the number of points ({})".format(len(self.points)))
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        bin_xy = self.bin_of(coords)
+        distances = np.empty((len(coords), k))
+        indices = np.empty((len(coords), k), dtype=np.intp)
+        pending = np.arange(len(coords))
+        ring = 1
+        while len(pending):
+            queries, candidates = self._gather(self._ring_bins(bin_xy[pending], ring))
+            delta = self.displacement(coords[pending][queries], candidates)
+            dist = np.hypot(delta[:, 0], delta[:, 1])
+            sort = np.lexsort((dist, queries))
+            queries, candidates, dist = queries[sort], candidates[sort], dist[sort]
+            counts = np.bincount(queries, minlength=len(pending))
+            rank = np.arange(len(queries)) - np.repeat(np.cumsum(counts) - counts, counts)
+            keep = rank < k
+            # every point within ring bin lengths of a query lies in the searched bins
+            covered = ring * self.bin_len.min()
+            wraps_all = (2 * ring + 1 >= self.num_bins).all()
+            full = counts >= k
+            kth = np.full(len(pending), np.inf)
+            kth[full] = dist[keep & (rank == k - 1)]
+            done = full & ((kth <= covered) | wraps_all)
+            rows = done[queries] & keep
+            distances[pending[done]] = dist[rows].reshape(-1, k)
+            indices[pending[done]] = candidates[rows].reshape(-1, k)
+            pending = pending[~done]
+            ring += 1
+        return distances, indices
+
+def distance_to_points(coords, targets, box_matrix):
+    """
+    Minimum image distance from every query position to the nearest target, e.g. from the
+    cell centres to the mesectoderm boundary vertices
+
+    return : numpy.ndarray : (M,) distances
+    """
+    return PeriodicGrid(targets, box_matrix).query_knn(coords, 1)[0][:, 0]
@@ -0,0 +1,202 @@
+import json
+import os
+
+import netCDF4 as nc
+import numpy as np
+
+COLUMNS = ('roughness', 'internalization', 'mean_width', 'width_variance', 'boundary_length',
+           'mean_area', 'mean_perimeter', 'mean_shape_index', 'mes_shape_index')
+
+class ResultsStore(object):
+    """
+    Columnar store of per-frame metrics of many runs in a single NetCDF file. Every column is
+    a (run, frame) float variable, with both dimensions unlimited so runs and frames can be
+    appended incrementally; frames that were never written read as nan. frames_done records
+    how many leading frames of each run have been written.
+
+    Every frame also records the analysis parameters it was computed with (params_index, an
+    index into the JSON parameter sets of param_sets, -1 for frames without a record), so a
+    sweep only resumes over the frames that were computed the same way.
+
+    path : file of the store, created if it does not exist
+    columns : metric columns of the store; columns missing from an existing store are added
+              (reading as nan for the frames already written)
+    """
+    def __init__(self, path, columns=COLUMNS):
+        if os.path.exists(path):
+            self.ds = nc.Dataset(path, 'a')
+        else:
+            self.ds = nc.Dataset(path, 'w')
+            self.ds.createDimension('run', None)
+            self.ds.createDimension('frame', None)
+            self.ds.createVariable('run_id', str, ('run',))
+            self.ds.createVariable('frames_done', 'i4', ('run',), fill_value=0)
+        if 'param_sets' not in self.ds.variables:
+            self.ds.createDimension('param_set', None)
+            self.ds.createVariable('param_sets', str, ('param_set',))
+            self.ds.createVariable('params_index', 'i4', ('run', 'frame'), fill_value=-1)
+        for column in columns:
+            if column not in self.ds.variables:
+                self.ds.createVariable(column, 'f8', ('run', 'frame'), fill_value=np.nan, zlib=True)
+        self.ds.set_auto_mask(False)
+        self.runs = {run_id: i for i, run_id in enumerate(self.ds.variables['run_id'][:])}
+        self.param_sets = {text: i for i, text in enumerate(self.ds.variables['param_sets'][:])}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def columns(self):
+        """return : list : the names of the metric columns"""
+        return [name for name, var in self.ds.variables.items()
+                if var.dimensions == ('run', 'frame') and name != 'params_index']
+
+    def run_ids(self):
+        """return : list : the run ids in the order they were added"""
+        return sorted(self.runs, key=self.runs.get)
+
+    def run_index(self, run_id):
+        """return : int : the row of a run, adding the run if it is new"""
+        if run_id not in self.runs:
+            index = len(self.runs)
+            self.ds.variables['run_id'][index] = run_id
+            self.ds.variables['frames_done'][index] = 0
+            self.runs[run_id] = index
+        return self.runs[run_id]
+
+    def frames_done(self, run_id):
+        """return : int : number of leading frames of the run that have been written"""
+        if run_id not in self.runs:
+            return 0
+        return int(self.ds.variables['frames_done'][self.runs[run_id]])
+
+    def params_id(self, params):
+        """
+        return : int : the index of a set of analysis parameters (a JSON serialisable dict) in
+                 param_sets, adding it if it is new
+        """
+        text = json.dumps(params, sort_keys=True)
+        if text not in self.param_sets:
+            index = len(self.param_sets)
+            self.ds.variables['param_sets'][index] = text
+            self.param_sets[text] = index
+        return self.param_sets[text]
+
+    def frame_params(self, run_id, frame):
+        """
+        return : dict : the analysis parameters a frame was computed with, or None if the frame
+                 has no record
+        """
+        if run_id not in self.runs or frame >= len(self.ds.dimensions['frame']):
+            return None
+        index = int(self.ds.variables['params_index'][self.runs[run_id], frame])
+        return None if index < 0 else json.loads(self.ds.variables['param_sets'][index])
+
+    def recorded_frames(self, run_id, params=None):
+        """
+        return : numpy.ndarray : the frames of a run that were written with a parameter record,
+                 or only those computed with params if it is given
+        """
+        if run_id not in self.runs:
+            return np.array([], dtype=int)
+        row = self.ds.variables['params_index'][self.runs[run_id], :]
+        if params is None:
+            return np.flatnonzero(row >= 0)
+        index = self.param_sets.get(json.dumps(params, sort_keys=True))
+        return np.flatnonzero(row == index) if index is not None else np.array([], dtype=int)
+
+    def append(self, run_id, frame, params=None, **values):
+        """
+        Writes the metrics of one frame of a run; columns not given are left untouched
+
+        params : analysis parameters to record for the frame (see write)
+        return : none
+        """
+        self.write(run_id, frame, params, **{name: [value] for name, value in values.items()})
+
+    def write(self, run_id, start, params=None, **columns):
+        """
+        Writes consecutive frames of a run, starting at frame start, from one array per column
+
+        params : dict of the analysis parameters the frames were computed with, recorded for
+                 every frame written (the previous record is kept if not given)
+        return : none
+        """
+        index = self.run_index(run_id)
+        length = 0
+        for name, values in columns.items():
+            values = np.asarray(values, dtype=float)
+            self.ds.variables[name][index, start:start + len(values)] = values
+            length = max(length, len(values))
+        if params is not None:
+            self.ds.variables['params_index'][index, start:start + length] = self.params_id(params)
+        done = self.ds.variables['frames_done']
+        if start <= done[index] < start + length:
+            # also count the recorded frames that were written earlier right after these
+            recorded = self.ds.variables['params_index'][index, start + length:] >= 0
+            following = len(recorded) if recorded.all() else int(np.argmin(recorded))
+            done[index] = start + length + following
+
+    def written_frames(self, run_id):
+        """
+        return : numpy.ndarray : the sorted frames of a run that have been written: those with a
+                 parameter record and the leading frames_done ones (written without a record)
+        """
+        if run_id not in self.runs:
+            return np.array([], dtype=int)
+        return np.union1d(self.recorded_frames(run_id), np.arange(self.frames_done(run_id)))
+
+    def read(self, column, run_id=None):
+        """
+        return : numpy.ndarray : the column for one run (the values of its written_frames, in
+                 frame order), or the whole (run, frame) table if run_id is None
+        """
+        var = self.ds.variables[column]
+        if run_id is None:
+            return var[:]
+        return var[self.runs[run_id], :][self.written_frames(run_id)]
+
+    def mean_over_runs(self, column):
+        """
+        Mean of a column over all runs for every frame, ignoring nan. Runs are read one at a
+        time, so memory does not grow with the number of runs
+
+        return : numpy.ndarray : (frame,) mean values (nan where no run has the frame)
+        """
+        var = self.ds.variables[column]
+        total = np.zeros(len(self.ds.dimensions['frame']))
+        count = np.zeros(len(total))
+        for index in range(len(self.runs)):
+            row = var[index, :]
+            valid = ~np.isnan(row)
+            total[:len(row)][valid] += row[valid]
+            count[:len(row)][valid] += 1
+        with np.errstate(invalid='ignore'):
+            return total / count
+
+    def to_csv(self, path, columns=None):
+        """
+        Exports the written frames of every run as CSV, one row per (run, frame), with the
+        frame numbers of the store (see written_frames)
+
+        columns : metric columns to export (all by default)
+        return : none
+        """
+        columns = columns or self.columns
+        with open(path, 'w') as f:
+            f.write(','.join(['run_id', 'frame'] + list(columns)) + '\n')
+            for run_id in self.run_ids():
+                frames = self.written_frames(run_id)
+                table = np.column_stack([self.read(column, run_id) for column in columns]).reshape(len(frames), -1)
+                for frame, row in zip(frames, table):
+                    f.write(','.join([run_id, str(frame)] + [repr(float(value)) for value in row]) + '\n')
+
+    def sync(self):
+        """Flushes the written data to disk"""
+        self.ds.sync()
+
+    def close(self):
+        self.ds.close()
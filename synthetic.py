@@ -0,0 +1,149 @@
+import argparse
+import os
+
+import netCDF4 as nc
+import numpy as np
+
+MAX_CELL_VERTICES = 16
+
+# corners of a hexagonal cell around its centre, counterclockwise, on the integer vertex lattice
+HEX_OFFSETS = np.array([(1, 1), (0, 2), (-1, 1), (-1, -1), (0, -2), (1, -1)])
+
+def hexagonal_tiling(nx, ny, box_len=20.0, mes_band=(0.4, 0.6)):
+    """
+    Builds a periodic tiling of nx * ny hexagonal cells in a square box, in the layout of the
+    simulation output. The cells whose centre lies in the horizontal band mes_band (fractions
+    of the box height) are mesectoderm (cellType 1), the others ectoderm (cellType 0).
+
+    nx : number of cells per row (at least 2)
+    ny : number of rows of cells (even, so the tiling is periodic)
+    return : dict : 'pos' (Nv, 2), 'Vneighs' (Nv, 3), 'VertexCellNeighbors' (Nv, 3), 'cellVer'
+             (Nc, 16) padded with -1, 'cellVerNum' (Nc,), 'cellType' (Nc,), 'cellPositions'
+             (Nc, 2) and 'BoxMatrix' (4,)
+    """
+    if nx < 2 or ny < 2 or ny % 2:
+        raise ValueError("the tiling needs at least 2 cells per row and an even number of rows")
+    width, height = 2 * nx, 3 * ny
+    rows, cols = np.divmod(np.arange(nx * ny), nx)
+    centres = np.c_[2 * cols + rows % 2, 3 * rows]
+    corners = (centres[:, None] + HEX_OFFSETS) % (width, height)
+    lattice_keys, cell_ver = np.unique(corners[..., 0] * height + corners[..., 1], return_inverse=True)
+    cell_ver = cell_ver.reshape(-1, 6)
+    num_v = len(lattice_keys)
+
+    # every vertex has three neighbours (the cell edges through it) and three cells
+    starts, ends = cell_ver.reshape(-1), np.roll(cell_ver, -1, axis=1).reshape(-1)
+    edge_keys = np.unique(np.r_[starts * num_v + ends, ends * num_v + starts])
+    neighbours = (edge_keys % num_v).reshape(num_v, 3)
+    cell_neighbours = (np.argsort(cell_ver.reshape(-1), kind='stable') // 6).reshape(num_v, 3)
+
+    scale = np.array([box_len / width, box_len / height])
+    cell_positions = centres * scale
+    padded = -np.ones((len(cell_ver), MAX_CELL_VERTICES), dtype=int)
+    padded[:, :6] = cell_ver
+    band = cell_positions[:, 1] / box_len
+    return {'pos': np.c_[lattice_keys // height, lattice_keys % height] * scale,
+            'Vneighs': neighbours,
+            'VertexCellNeighbors': cell_neighbours,
+            'cellVer': padded,
+            'cellVerNum': np.full(len(cell_ver), 6),
+            'cellType': ((band >= mes_band[0]) & (band < mes_band[1])).astype(int),
+            'cellPositions': cell_positions,
+            'BoxMatrix': np.array([box_len, 0.0, 0.0, box_len])}
+
+def perturb(tiling, amplitude=0.05, rng=None):
+    """
+    Displaces every vertex (and moves every cell centre) by gaussian noise, wrapped back into
+    the box
+
+    amplitude : standard deviation of the displacements, as a fraction of the mean edge length
+    return : dict : a copy of the tiling with new 'pos' and 'cellPositions'
+    """
+    rng = np.random.default_rng(rng)
+    box = tiling['BoxMatrix'][[0, 3]]
+    edge_len = box[0] / np.sqrt(len(tiling['cellType']))
+    frame = dict(tiling)
+    frame['pos'] = (tiling['pos'] + rng.normal(0, amplitude * edge_len, tiling['pos'].shape)) % box
+    frame['cellPositions'] = (tiling['cellPositions']
+                              + rng.normal(0, amplitude * edge_len, tiling['cellPositions'].shape)) % box
+    return frame
+
+def write_frames(path, frame_list, format='NETCDF4'):
+    """
+    Writes frames to a NetCDF file with the schema of the simulation output: one row per
+    frame along the unlimited time dimension, with every variable flattened
+
+    frame_list : list of dicts as returned by hexagonal_tiling or perturb
+    format : NetCDF file format, e.g. 'NETCDF3_64BIT_OFFSET' for the classic format cellGPU
+             writes (whose variables have no chunking)
+    return : none
+    """
+    num_v, num_cell = len(frame_list[0]['pos']), len(frame_list[0]['cellType'])
+    with nc.Dataset(path, 'w', format=format) as ds:
+        ds.createDimension('time', None)
+        ds.createDimension('Nv', num_v)
+        ds.createDimension('Nc', num_cell)
+        ds.createDimension('dof', 2 * num_v)
+        ds.createDimension('vertexNeighbors', 3 * num_v)
+        ds.createDimension('cellDof', 2 * num_cell)
+        ds.createDimension('cellVertices', MAX_CELL_VERTICES * num_cell)
+        ds.createDimension('boxdim', 4)
+        variables = {'pos': ('f8', 'dof'), 'Vneighs': ('i4', 'vertexNeighbors'),
+                     'VertexCellNeighbors': ('i4', 'vertexNeighbors'), 'cellVer': ('i4', 'cellVertices'),
+                     'cellVerNum': ('i4', 'Nc'), 'cellType': ('i4', 'Nc'),
+                     'cellPositions': ('f8', 'cellDof'), 'BoxMatrix': ('f8', 'boxdim')}
+        for name, (dtype, dim) in variables.items():
+            ds.createVariable(name, dtype, ('time', dim))
+        ds.createVariable('time', 'i4', ('time',))
+        for num_it, frame in enumerate(frame_list):
+            ds.variables['time'][num_it] = num_it
+            for name in variables:
+                ds.variables[name][num_it] = np.asarray(frame[name]).reshape(-1)
+
+def make_runs(directory, size=20, runs=2, num_frames=5, amplitude=0.05, multi_timestep=False, seed=0,
+              format='NETCDF4'):
+    """
+    Writes synthetic runs: either one file per frame named like the simulation output
+    (run_p<run>.<frame>.nc) or one multi-timestep file per run, named like a trajectory starting
+    at frame 0 (run_p<run>.000.nc), so frames.parse_frame_name gives the run id run_p<run> either way
+
+    size : number of cells per row and rows of cells of the tiling
+    format : NetCDF file format of the files (see write_frames)
+    return : list : the paths written
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    tiling = hexagonal_tiling(size, size + size % 2)
+    paths = []
+    for run in range(1, runs + 1):
+        frame_list = [perturb(tiling, amplitude, rng) for _ in range(num_frames)]
+        if multi_timestep:
+            paths.append(os.path.join(directory, 'run_p{}.000.nc'.format(run)))
+            write_frames(paths[-1], frame_list, format)
+        else:
+            for num_it, frame in enumerate(frame_list):
+                paths.append(os.path.join(directory, 'run_p{}.{:03d}.nc'.format(run, num_it)))
+                write_frames(paths[-1], [frame], format)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic vertex model runs from a hexagonal tiling")
+    parser.add_argument('directory', help="output directory")
+    parser.add_argument('--size', type=int, default=20, help="cells per row and rows of cells")
+    parser.add_argument('--runs', type=int, default=2)
+    parser.add_argument('--frames', type=int, default=5)
+    parser.add_argument('--amplitude', type=float, default=0.05, help="vertex noise, relative to the edge length")
+    parser.add_argument('--multi-timestep', action='store_true', help="write one multi-timestep file per run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', default='NETCDF4', choices=['NETCDF4', 'NETCDF4_CLASSIC', 'NETCDF3_CLASSIC',
+                                                                'NETCDF3_64BIT_OFFSET'],
+                        help="NetCDF file format (cellGPU writes NETCDF3_64BIT_OFFSET)")
+    args = parser.parse_args(argv)
+
+    paths = make_runs(args.directory, size=args.size, runs=args.runs, num_frames=args.frames,
+                      amplitude=args.amplitude, multi_timestep=args.multi_timestep, seed=args.seed,
+                      format=args.format)
+    print("{} files written to {}".format(len(paths), args.directory))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import collections
+
+import numpy as np
+import pytest
+
+import batch
+import frames
+import profiling
+import store
+import synthetic
+
+AXIS_WINDOW = (0, 20, 6, 14)
+
+def test_multi_timestep_runs(tmp_path):
+    paths = synthetic.make_runs(str(tmp_path), size=12, runs=2, num_frames=4, multi_timestep=True)
+    assert sorted(frames.parse_frame_name(path)[0] for path in paths) == ['run_p1', 'run_p2']
+    store_path = str(tmp_path / 'results.nc')
+    batch.run_batch(str(tmp_path / '*.nc'), store_path, workers=1, frame_range=(1, None), axis_window=AXIS_WINDOW)
+    with store.ResultsStore(store_path) as results:
+        for run_id in ('run_p1', 'run_p2'):
+            np.testing.assert_array_equal(results.written_frames(run_id), [1, 2, 3])
+            roughness = results.read('roughness', run_id)
+            assert np.isfinite(roughness).all() and len(set(roughness)) == 3
+
+@pytest.mark.parametrize('boundary_mode', ['geometry', 'image'])
+def test_frames_without_boundary_are_skipped(tmp_path, boundary_mode):
+    tiling = synthetic.hexagonal_tiling(12, 12)
+    uniform = dict(tiling, cellType=np.zeros_like(tiling['cellType']))
+    (tmp_path / 'data').mkdir()
+    path = str(tmp_path / 'data' / 'run_p1.000.nc')
+    synthetic.write_frames(path, [tiling, uniform, tiling])
+    cache_dir = str(tmp_path / 'cache')
+    assert batch.analyse_frame(path, 1, axis_window=AXIS_WINDOW,
+                               boundary_mode=boundary_mode, cache_dir=cache_dir) is None
+    store_path = str(tmp_path / 'results.nc')
+    for prefetch in (None, 2):
+        batch.run_batch(str(tmp_path / 'data' / '*.nc'), store_path, workers=1, prefetch=prefetch,
+                        axis_window=AXIS_WINDOW, boundary_mode=boundary_mode, cache_dir=cache_dir)
+        with store.ResultsStore(store_path) as results:
+            np.testing.assert_array_equal(results.written_frames('run_p1'), [0, 2])
+            np.testing.assert_array_equal(results.recorded_frames('run_p1'), [0, 2])
+
+def test_pipelined_profile_has_io_stages(tmp_path):
+    synthetic.make_runs(str(tmp_path / 'data'), size=12, runs=1, num_frames=2)
+    profile_log = str(tmp_path / 'profile.jsonl')
+    batch.run_batch(str(tmp_path / 'data' / '*.nc'), str(tmp_path / 'results.nc'), prefetch=2,
+                    axis_window=AXIS_WINDOW, image_dir=str(tmp_path / 'images'), profile_log=profile_log)
+    counts = collections.Counter(record['stage'] for record in profiling.read_log(profile_log))
+    assert counts['read'] == counts['save'] == counts['save_image'] == 2
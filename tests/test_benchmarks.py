@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import benchmark as suite
+
+# small enough for every test run; python benchmark.py --sizes ... times the larger systems
+SIZES = (16, 32)
+
+@pytest.fixture(scope='module', params=SIZES, ids=lambda size: 'size{}'.format(size))
+def fixture(request, tmp_path_factory):
+    return suite.make_fixture(request.param, str(tmp_path_factory.mktemp('synthetic')))
+
+def test_edges(fixture, benchmark):
+    segments = benchmark(suite.bench_edges(fixture))
+    assert segments.shape[1:] == (2, 2)
+    # every edge is drawn once, and split in two at most when it crosses the box
+    num_edges = 3 * len(fixture['pos']) // 2
+    assert num_edges <= len(segments) <= 2 * num_edges
+
+def test_boundary(fixture, benchmark):
+    vertices, lines = benchmark(suite.bench_boundary(fixture))
+    assert len(lines) and len(vertices)
+
+def test_sweeper(fixture, benchmark):
+    upper, lower = benchmark(suite.bench_sweeper(fixture))
+    assert len(upper) == fixture['image'].shape[1]
+    assert (upper[:, 1] <= lower[:, 1]).all()
+
+def test_rotate(fixture, benchmark):
+    rotated_upper, rotated_lower = benchmark(suite.bench_rotate(fixture))
+    assert rotated_upper.shape == fixture['upper'].shape
+
+def test_roughness(fixture, benchmark):
+    assert np.isfinite(benchmark(suite.bench_roughness(fixture)))
+
+def test_load_frame(fixture, benchmark):
+    frame = benchmark(suite.bench_load_frame(fixture))
+    np.testing.assert_allclose(frame['pos'], fixture['pos'])
+
+@pytest.mark.parametrize('key', ['trajectory_path', 'classic_path'], ids=['netcdf4', 'netcdf3'])
+def test_read_trajectory(fixture, benchmark, key):
+    benchmark(suite.bench_read_trajectory(fixture, key))
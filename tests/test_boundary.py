@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+import synthetic
+import utils
+
+def baseline_find_mesectoderm_boundary(numv, Vneighs, Vcellneighs, cellType, vposx, vposy):
+    """
+    The original per-vertex loop of find_mesectoderm_boundary, kept as the reference: every
+    boundary edge is reported from both of its vertices
+
+    return : set, list : the boundary vertex indices and the boundary segments
+    """
+    Vneighs_trans = np.reshape(Vneighs, (-1, 3))
+    Vcellneighs_trans = np.reshape(Vcellneighs, (-1, 3))
+    mes_ver_list = []
+    mes_lines = []
+    for i in range(numv):
+        curr_v_cellneighs = Vcellneighs_trans[i]
+        for neighbour in Vneighs_trans[i]:
+            second_v_cellneighs = Vcellneighs_trans[neighbour]
+            common_cell_neighbours = list(set(curr_v_cellneighs).intersection(second_v_cellneighs))
+            temp_mes_count, temp_non_count = 0, 0
+            for cell in common_cell_neighbours:
+                if cellType[cell] == 1:
+                    temp_mes_count += 1
+                else:
+                    temp_non_count += 1
+            if temp_mes_count == 1 and temp_non_count == 1:
+                mes_ver_list.append(i)
+                mes_ver_list.append(neighbour)
+                mes_lines.append([(vposx[i], vposy[i]), (vposx[neighbour], vposy[neighbour])])
+    return set(mes_ver_list), mes_lines
+
+def segment_set(lines):
+    """return : set : the segments as unordered pairs of points"""
+    return {frozenset(map(tuple, segment)) for segment in np.asarray(lines, dtype=float).tolist()}
+
+def random_frame(size, seed, mes_fraction=0.5):
+    """return : dict : a perturbed size x size tiling with random cell types"""
+    rng = np.random.default_rng(seed)
+    frame = synthetic.perturb(synthetic.hexagonal_tiling(size, size), rng=rng)
+    frame['cellType'] = (rng.random(len(frame['cellType'])) < mes_fraction).astype(int)
+    return frame
+
+@pytest.mark.parametrize('size', [4, 10, 24])
+@pytest.mark.parametrize('seed', range(3))
+def test_matches_baseline(size, seed):
+    frame = random_frame(size, seed)
+    pos, args = frame['pos'], (frame['Vneighs'], frame['VertexCellNeighbors'], frame['cellType'])
+    expected_vertices, expected_lines = baseline_find_mesectoderm_boundary(len(pos), *args, pos[:, 0], pos[:, 1])
+
+    vertices, lines, edges = utils.find_mesectoderm_boundary(len(pos), *args, pos[:, 0], pos[:, 1],
+                                                             return_edges=True)
+    assert set(vertices.tolist()) == {int(v) for v in expected_vertices}
+    assert segment_set(lines) == segment_set(expected_lines)
+    # deduplicated: every edge once, from its lower vertex index to its higher one
+    assert len(lines) == len(segment_set(expected_lines))
+    assert (edges[:, 0] < edges[:, 1]).all()
+    np.testing.assert_array_equal(lines, pos[edges])
+
+def test_flat_and_reshaped_inputs_agree():
+    frame = random_frame(10, 7)
+    pos = frame['pos']
+    flat = utils.find_mesectoderm_boundary(len(pos), frame['Vneighs'].reshape(-1),
+                                           frame['VertexCellNeighbors'].reshape(-1), frame['cellType'],
+                                           pos[:, 0], pos[:, 1])
+    shaped = utils.find_mesectoderm_boundary(len(pos), frame['Vneighs'], frame['VertexCellNeighbors'],
+                                             frame['cellType'], pos[:, 0], pos[:, 1])
+    np.testing.assert_array_equal(flat[0], shaped[0])
+    np.testing.assert_array_equal(flat[1], shaped[1])
+
+@pytest.mark.parametrize('cell_type', [0, 1])
+def test_uniform_tissue_has_no_boundary(cell_type):
+    frame = random_frame(6, 0)
+    frame['cellType'][:] = cell_type
+    pos = frame['pos']
+    vertices, lines = utils.find_mesectoderm_boundary(len(pos), frame['Vneighs'], frame['VertexCellNeighbors'],
+                                                      frame['cellType'], pos[:, 0], pos[:, 1])
+    assert len(vertices) == 0
+    assert lines.shape[0] == 0
+
+def test_failed_image_write_raises(tmp_path):
+    with pytest.raises(IOError):
+        utils.write_image(str(tmp_path / 'missing' / 'boundary.png'), np.zeros((4, 4, 3), np.uint8))
+
+def test_stacked_mesectoderm_vertices():
+    stack = [random_frame(8, seed) for seed in range(3)]
+    num_v = len(stack[0]['pos'])
+    vcellneigh = np.stack([frame['VertexCellNeighbors'] for frame in stack])
+    cell_types = np.stack([frame['cellType'] for frame in stack])
+    expected = [utils.get_mesectoderm_vertex_indices(num_v, np.flatnonzero(frame['cellType'] == 1),
+                                                     frame['VertexCellNeighbors']) for frame in stack]
+
+    cell_indices = utils.get_mesectoderm_cell_indices(cell_types.shape[1], cell_types)
+    for mes_cells in (cell_indices, cell_types == 1):
+        frame_idx, vertex_idx = utils.get_mesectoderm_vertex_indices(num_v, mes_cells, vcellneigh)
+        for f, vertices in enumerate(expected):
+            np.testing.assert_array_equal(vertex_idx[frame_idx == f], vertices)
+    with pytest.raises(ValueError):
+        utils.get_mesectoderm_vertex_indices(num_v, cell_indices[1], vcellneigh)
+
+def test_cell_geometry_without_box():
+    square = {'pos': np.array([[1.0, 1.0], [3.0, 1.0], [3.0, 3.0], [1.0, 3.0]]),
+              'cellVer': np.r_[np.arange(4), np.full(12, -1)], 'cellVerNum': np.array([4])}
+    geometry = utils.cell_geometry(square['pos'], square['cellVer'], square['cellVerNum'], None)
+    np.testing.assert_allclose(geometry['centroid'], [[2.0, 2.0]])
+    np.testing.assert_allclose(geometry['area'], [4.0])
+    np.testing.assert_allclose(geometry['perimeter'], [8.0])
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import spatial
+
+def brute_force_distances(points, coords, box):
+    delta = points[None] - coords[:, None]
+    delta -= box * np.round(delta / box)
+    return np.hypot(delta[..., 0], delta[..., 1])
+
+@pytest.fixture(params=[(5, 10.0), (300, 20.0), (5000, 50.0)], ids=['tiny', 'small', 'large'])
+def grid(request):
+    num_points, box_len = request.param
+    rng = np.random.default_rng(num_points)
+    box = np.array([box_len, 0.7 * box_len])
+    points = rng.uniform(0, 1, (num_points, 2)) * box
+    coords = rng.uniform(-5, 1.2 * box_len, (40, 2))
+    return spatial.PeriodicGrid(points, [box[0], 0, 0, box[1]]), points, box, coords
+
+def test_query_knn(grid):
+    grid, points, box, coords = grid
+    k = min(4, len(points))
+    distances, indices = grid.query_knn(coords, k)
+    expected = brute_force_distances(points, coords, box)
+    np.testing.assert_allclose(distances, np.sort(expected, axis=1)[:, :k])
+    np.testing.assert_allclose(np.take_along_axis(expected, indices, axis=1), distances)
+
+def test_query_radius(grid):
+    grid, points, box, coords = grid
+    expected = brute_force_distances(points, coords, box)
+    for found, dist in zip(grid.query_radius(coords, 3.0), expected):
+        np.testing.assert_array_equal(found, np.flatnonzero(dist <= 3.0))
+    np.testing.assert_array_equal(grid.query_radius(coords[0], 3.0), grid.query_radius(coords[:1], 3.0)[0])
+
+def test_query_box_wraps(grid):
+    grid, points, box, _ = grid
+    window = (box[0] - 2, box[0] + 3, 1, 5)
+    offset = (points - [window[0], window[2]]) % box
+    expected = np.flatnonzero((offset[:, 0] <= 5) & (offset[:, 1] <= 4))
+    np.testing.assert_array_equal(grid.query_box(window), expected)
+
+def test_knn_rejects_too_many_neighbours():
+    grid = spatial.PeriodicGrid(np.zeros((3, 2)), [1.0, 0, 0, 1.0])
+    with pytest.raises(ValueError):
+        grid.query_knn(np.zeros((1, 2)), 4)
+
+def test_distance_to_points():
+    rng = np.random.default_rng(2)
+    targets, coords = rng.uniform(0, 10, (50, 2)), rng.uniform(0, 10, (20, 2))
+    box = np.array([10.0, 10.0])
+    np.testing.assert_allclose(spatial.distance_to_points(coords, targets, [10.0, 0, 0, 10.0]),
+                               brute_force_distances(targets, coords, box).min(axis=1))
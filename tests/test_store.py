@@ -0,0 +1,28 @@
+import numpy as np
+
+import store
+
+PARAMS = {'version': 1, 'stages': ['boundary']}
+
+def test_frames_written_out_of_order_are_read(tmp_path):
+    path = str(tmp_path / 'results.nc')
+    with store.ResultsStore(path) as results:
+        results.append('run_p1', 3, PARAMS, roughness=3.0)
+        results.append('run_p1', 2, PARAMS, roughness=2.0)
+        np.testing.assert_array_equal(results.written_frames('run_p1'), [2, 3])
+        np.testing.assert_array_equal(results.read('roughness', 'run_p1'), [2.0, 3.0])
+        results.append('run_p1', 0, PARAMS, roughness=0.0)
+        assert results.frames_done('run_p1') == 1
+        results.to_csv(str(tmp_path / 'results.csv'))
+    rows = open(str(tmp_path / 'results.csv')).read().splitlines()[1:]
+    assert [row.split(',')[:3] for row in rows] == [['run_p1', '0', '0.0'], ['run_p1', '2', '2.0'],
+                                                   ['run_p1', '3', '3.0']]
+
+def test_resume_records(tmp_path):
+    with store.ResultsStore(str(tmp_path / 'results.nc')) as results:
+        results.append('run_p1', 0, PARAMS, roughness=1.0)
+        results.append('run_p1', 1, dict(PARAMS, version=2), roughness=1.0)
+        np.testing.assert_array_equal(results.recorded_frames('run_p1', PARAMS), [0])
+        np.testing.assert_array_equal(results.recorded_frames('run_p1'), [0, 1])
+        assert results.frame_params('run_p1', 1) == dict(PARAMS, version=2)
+        assert results.frame_params('run_p1', 5) is None
@@ -0,0 +1,46 @@
+import numpy as np
+
+import synthetic
+import utils
+
+def test_tracker_matches_full_recomputation():
+    rng = np.random.default_rng(0)
+    tiling = synthetic.hexagonal_tiling(20, 20)
+    neighbours, cell_neighbours = tiling['Vneighs'].copy(), tiling['VertexCellNeighbors'].copy()
+    cell_type = tiling['cellType'].copy()
+    tracker = utils.BoundaryTracker()
+    for step in range(30):
+        flip = rng.integers(0, len(cell_type), 3)
+        cell_type[flip] ^= 1
+        # reorder a few neighbour lists (same sets) to exercise the changed-vertex path
+        rows = rng.integers(0, len(neighbours), 5)
+        neighbours[rows] = neighbours[rows][:, ::-1]
+        cell_neighbours[rows] = cell_neighbours[rows][:, [1, 2, 0]]
+        np.testing.assert_array_equal(tracker.update(neighbours, cell_neighbours, cell_type),
+                                      utils.find_boundary_edges(neighbours, cell_neighbours, cell_type))
+
+def test_unchanged_frame_keeps_boundary():
+    tiling = synthetic.hexagonal_tiling(10, 10)
+    tracker = utils.BoundaryTracker()
+    first = tracker.update(tiling['Vneighs'], tiling['VertexCellNeighbors'], tiling['cellType'])
+    second = tracker.update(tiling['Vneighs'], tiling['VertexCellNeighbors'], tiling['cellType'])
+    np.testing.assert_array_equal(first, second)
+    assert len(first)
+
+def test_new_system_size_restarts():
+    tracker = utils.BoundaryTracker()
+    for size in (8, 12, 8):
+        tiling = synthetic.hexagonal_tiling(size, size)
+        np.testing.assert_array_equal(
+            tracker.update(tiling['Vneighs'], tiling['VertexCellNeighbors'], tiling['cellType']),
+            utils.find_boundary_edges(tiling['Vneighs'], tiling['VertexCellNeighbors'], tiling['cellType']))
+
+def test_find_boundary_matches_find_mesectoderm_boundary():
+    rng = np.random.default_rng(3)
+    frame = synthetic.perturb(synthetic.hexagonal_tiling(12, 12), rng=rng)
+    pos = frame['pos']
+    args = (frame['Vneighs'], frame['VertexCellNeighbors'], frame['cellType'], pos[:, 0], pos[:, 1])
+    vertices, lines, edges = utils.BoundaryTracker().find_boundary(*args)
+    expected = utils.find_mesectoderm_boundary(len(pos), *args, return_edges=True)
+    for value, expected_value in zip((vertices, lines, edges), expected):
+        np.testing.assert_array_equal(value, expected_value)
@@ -1,15 +1,16 @@
 import netCDF4 as nc
 import numpy as np
-import matplotlib.pyplot as plt
 from matplotlib import collections as mc
 from matplotlib import colors
-from matplotlib.patches import Polygon
-from matplotlib.collections import PatchCollection
-from collections import OrderedDict
-import glob
 import cv2
 import os
 
+import frames
+import render
+
+class NoBoundaryError(ValueError):
+    """Raised when a frame has no mesectoderm boundary to extract curves from"""
+
 def get_dataset(fname):
     """
     Function that reads nc data from a file using netCDF4 library
@@ -37,73 +38,132 @@ def tuple_sub(tuple1, tuple2):
     """
     return tuple(map(lambda x, y: x - y, tuple1, tuple2))
 
-def seperate_celltype(cellpos, celltypes): 
+def get_box_lengths(box_matrix):
+    """
+    Function that extracts the periodic box side lengths from a BoxMatrix entry. Accepts a
+    scalar side length, a flattened [xx, xy, yx, yy] row, or the whole (time, 4) variable
+    (in which case the first row is used)
+
+    return : numpy.ndarray : the [Lx, Ly] side lengths of the box
+    """
+    box = np.asarray(box_matrix, dtype=float)
+    if box.ndim == 0:
+        return np.array([box, box], dtype=float)
+    if box.ndim > 1:
+        box = box.reshape(-1, box.shape[-1])[0]
+    if box.size == 4:
+        return box[[0, 3]]
+    return np.array([box[0], box[0]], dtype=float)
+
+def periodic_segments(p1, p2, box_matrix, return_index=False):
+    """
+    Function that builds the line segments joining pairs of points, following the periodic
+    boundary conditions. A pair that does not cross the box boundary gives one segment
+    [p1, p2]. A pair that wraps around the box is split into two segments, [p1, p1 - d] and
+    [p2, p2 + d], where d is the minimum image of p1 - p2, so each half runs from its own
+    endpoint out past the box boundary.
+
+    p1, p2 : (M, 2) arrays of endpoint coordinates
+    box_matrix : box side length or BoxMatrix entry (see get_box_lengths)
+    return : numpy.ndarray : (E, 2, 2) array of segments (split pairs keep their two halves
+             next to each other), and if return_index is set, the (E,) array giving the pair
+             each segment came from
+    """
+    p1 = np.asarray(p1, dtype=float).reshape(-1, 2)
+    p2 = np.asarray(p2, dtype=float).reshape(-1, 2)
+    box = get_box_lengths(box_matrix)
+
+    point_diff = p1 - p2
+    wrapped_diff = point_diff - box * np.round(point_diff / box)
+    split = np.any(wrapped_diff != point_diff, axis=1)
+
+    counts = 1 + split
+    index = np.repeat(np.arange(len(p1)), counts)
+    first = np.cumsum(counts) - counts      # slot of the first segment of each pair
+    segments = np.empty((len(index), 2, 2))
+    segments[first, 0] = p1
+    segments[first, 1] = np.where(split[:, None], p1 - wrapped_diff, p2)
+    second = first[split] + 1
+    segments[second, 0] = p2[split]
+    segments[second, 1] = p2[split] + wrapped_diff[split]
+
+    if return_index:
+        return segments, index
+    return segments
+
+def build_edge_segments(pos, Vneighs, box_matrix, unique=False, return_index=False):
+    """
+    Function that builds the line segments of every cell edge in a frame in one batched pass,
+    splitting edges that wrap around the periodic box (see periodic_segments)
+
+    pos : interleaved [x0, y0, x1, y1, ...] vertex positions of one frame (or an (Nv, 2) array)
+    Vneighs : 3 * Nv array of vertex neighbours of the same frame
+    box_matrix : box side length or BoxMatrix entry
+    unique : if set, every edge is only built once (from its lower vertex index) instead of
+             once from each end
+    return : numpy.ndarray : (E, 2, 2) array of segments, and if return_index is set, the (E,)
+             array of flat Vneighs indices (vertex k // 3, neighbour Vneighs[k]) of each segment
     """
-    cellpos : 1 x 2n array of cell positions
-    celltypes: 1 x n array of celltype
+    pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+    neighbours = np.asarray(Vneighs).reshape(-1).astype(np.intp)
+    pairs = np.arange(len(neighbours))
+    if unique:
+        pairs = pairs[pairs // 3 < neighbours]
+    segments, index = periodic_segments(pos[pairs // 3], pos[neighbours[pairs]], box_matrix,
+                                        return_index=True)
+    if return_index:
+        return segments, pairs[index]
+    return segments
+
+def seperate_celltype(cellpos, celltypes):
     """
-    t1x, t1y, t2x, t2y = [], [], [], []
-    for i in range(0, len(cellpos)-1,2):
-        if celltypes[i//2] == 0:
-            t1x.append(cellpos[i])
-            t1y.append(cellpos[i+1])
-        elif celltypes[i//2] == 1:
-            t2x.append(cellpos[i])
-            t2y.append(cellpos[i+1])
-    return t1x, t1y, t2x, t2y
+    cellpos : 1 x 2n array of cell positions (or an (F, 2n) stack of frames)
+    celltypes: 1 x n array of celltype (or an (F, n) stack of frames)
+    return : numpy.ndarray x4 : x and y coordinates of the type 0 cells, then of the type 1
+             cells (the cells of stacked frames are concatenated in frame order)
+    """
+    celltypes = np.asarray(celltypes)
+    cellpos = np.asarray(cellpos).reshape(celltypes.shape + (2,))
+    type0, type1 = cellpos[celltypes == 0], cellpos[celltypes == 1]
+    return type0[:, 0], type0[:, 1], type1[:, 0], type1[:, 1]
 
-def read_files(file_dir):
+def read_files(file_dir, max_open=8):
     """
     Function that reads an nc file directory where each nc file is a timestamp frame
 
-    return : collections.OrderedDict : a dictionary of extracted netCDF4.Dataset frame
-             data (in order of appearance).  
+    return : frames.FrameSequence : a lazy sequence of the netCDF4.Dataset frames, ordered
+             naturally by run id and timestep. Files are only opened on access, with at most
+             max_open open at a time
     """
-    frames = OrderedDict()
-    for file in glob.glob(file_dir):
-        frames[file] = get_dataset(file)
-    return frames
+    return frames.FrameSequence(file_dir, max_open=max_open)
 
 
-def draw_frame(frame_num, curr, ax, num_edge, t1x, t1y, t2x, t2y, mesectoderm_vertices):
+def draw_frame(frame_num, curr, ax, num_edge, t1x, t1y, t2x, t2y, mesectoderm_vertices, Vneighs, vpos_x, vpos_y,
+               box_side_len):
     """
-    
+    Draws the cell centres by cell type and the cell edges of a frame, with the edges between
+    two mesectoderm vertices in crimson
+
+    curr : index of the first vertex whose edges are drawn
+    num_edge : number of Vneighs entries to draw (three per vertex)
+    t1x, t1y, t2x, t2y : cell centre coordinates of each cell type (see seperate_celltype)
+    Vneighs : Vneighs variable of the dataset, indexed by frame_num
+    vpos_x, vpos_y : vertex coordinates of the frame
+    box_side_len : side length of the periodic box
     """
-    #global curr, ax, num_edge, t1x, t1y, t2x, t2y, num_cell, mesectoderm_vertices
-
     ax.scatter(t1x, t1y,  c='tab:blue', alpha=0.3, edgecolors='none')
     ax.scatter(t2x, t2y,  c='tab:red', alpha=0.3, edgecolors='none')
     
-    
-    for i in range(0, num_edge, 3):
-        for j in range(0, 3):
-            v = Vneighs[frame_num][i+j]
-            cur_p = (vpos_x[curr], vpos_y[curr])
-            p = (vpos_x[v], vpos_y[v])
-            line = []
-            point_diff = np.subtract(np.asarray(cur_p), np.asarray(p))
-            if np.linalg.norm(point_diff) < box_side_len/2:
-                line.append([cur_p, p]);
-            else:
-                if point_diff[0] > box_side_len/2:
-                    point_diff[0] -= box_side_len
-                if point_diff[0] < -box_side_len/2:
-                    point_diff[0] += box_side_len
-                if point_diff[1] > box_side_len/2:
-                    point_diff[1] -= box_side_len
-                if point_diff[1] < -box_side_len/2:
-                    point_diff[1] += box_side_len
-                line.append([cur_p, tuple_sub(cur_p, point_diff)])
-                line.append([p, tuple_add(p, point_diff)])
-            
-            # check if mesectoderm cell edge           
-            if curr in mesectoderm_vertices and v in mesectoderm_vertices:
-                lc = mc.LineCollection(line, linewidths=1, colors=colors.to_rgba('Crimson'))
-            else:
-                lc = mc.LineCollection(line, linewidths=1, colors=(0, 0, 0, 1))
-            
-            ax.add_collection(lc)
-        curr += 1
+    pos = np.c_[vpos_x, vpos_y]
+    neighbours = np.asarray(Vneighs[frame_num][:num_edge]).astype(np.intp)
+    sources = curr + np.arange(len(neighbours)) // 3
+    segments, index = periodic_segments(pos[sources], pos[neighbours], box_side_len, return_index=True)
+
+    # check if mesectoderm cell edge
+    mes_vertices = np.fromiter(mesectoderm_vertices, dtype=np.intp)
+    is_mes = np.isin(sources, mes_vertices) & np.isin(neighbours, mes_vertices)
+    ax.add_collection(mc.LineCollection(segments[is_mes[index]], linewidths=1, colors=colors.to_rgba('Crimson')))
+    ax.add_collection(mc.LineCollection(segments[~is_mes[index]], linewidths=1, colors=(0, 0, 0, 1)))
 
 
 def first_item(guh):
@@ -114,151 +174,460 @@ def first_item(guh):
     """
     return next(iter(guh.items()))
 
-def convert_img_to_mov(image_dir, video_dir):
+def convert_img_to_mov(image_dir, video_dir, fps=1, codec=0):
     """
     This function reads a directory of images and creates a .avi movie file, treating 
-    the sequential order of each image as consecutive frames.
+    the sequential order of each image (natural order of the file names) as consecutive frames.
+    To make a movie straight from simulation data without saving images, see video.py.
 
+    codec : fourcc code string (e.g. 'mp4v'), or 0 for uncompressed frames
     return : none 
     """
-    images = [img for img in os.listdir(image_dir) if img.endswith(".png")]
+    images = sorted([img for img in os.listdir(image_dir) if img.endswith(".png")], key=frames.natural_key)
     frame = cv2.imread(os.path.join(image_dir, images[0]))
     height, width, layers = frame.shape
 
-    video = cv2.VideoWriter(video_dir, 0, 1, (width,height))
+    fourcc = cv2.VideoWriter_fourcc(*codec) if codec else 0
+    video = cv2.VideoWriter(video_dir, fourcc, fps, (width,height))
 
-    for image in images:
+    video.write(frame)
+    for image in images[1:]:
         video.write(cv2.imread(os.path.join(image_dir, image)))
 
     cv2.destroyAllWindows()
     video.release()
 
+def mesectoderm_cell_mask(celltypelist):
+    """
+    celltypelist : (Nc,) cell types, or an (F, Nc) stack of frames
+    return : numpy.ndarray : boolean mask of the mesectoderm cells, of the same shape
+    """
+    return np.asarray(celltypelist) == 1
+
+def mesectoderm_vertex_mask(Vcellneigh, cell_mask):
+    """
+    Marks the vertices that belong to at least one cell of cell_mask
+
+    Vcellneigh : VertexCellNeighbors, flat (3Nv,) or (Nv, 3), or an (F, ...) stack of frames
+    cell_mask : (Nc,) boolean cell mask (see mesectoderm_cell_mask), or an (F, Nc) stack
+    return : numpy.ndarray : (Nv,) or (F, Nv) boolean vertex mask
+    """
+    cell_mask = np.asarray(cell_mask, dtype=bool)
+    batch = cell_mask.shape[:-1]
+    cells = np.asarray(Vcellneigh).reshape(batch + (-1,)).astype(np.intp, copy=False)
+    # negative entries mark missing neighbour cells
+    member = np.take_along_axis(cell_mask, np.maximum(cells, 0), axis=-1) & (cells >= 0)
+    return member.reshape(batch + (-1, 3)).any(axis=-1)
+
 def get_mesectoderm_cell_indices(numcell, celltypelist):
     """
-    
-    return : list of cell indices of the mesectoderm
-    """
-    ans = []
-    for i in range(numcell):
-        if celltypelist[i] == 1:
-            ans.append(i)
-    return ans
-
-def get_mesectoderm_vertex_coords(mes_vert_idx, vert_px, vert_py, ax):
-    x, y = [], []
-    for i in range(0, len(mes_vert_idx)):
-        x.append(vert_px[mes_vert_idx[i]])
-        y.append(vert_py[mes_vert_idx[i]])
-    return x, y
-    
+    Finds the mesectoderm cells (cellType 1) among the first numcell cells
+
+    return : numpy.ndarray : indices of the mesectoderm cells; for an (F, Nc) stack of frames,
+             the (frame, cell) index arrays of np.nonzero
+    """
+    mask = mesectoderm_cell_mask(celltypelist)[..., :numcell]
+    return np.flatnonzero(mask) if mask.ndim == 1 else np.nonzero(mask)
+
+def get_mesectoderm_vertex_coords(mes_vert_idx, vert_px, vert_py, ax=None):
+    """
+    mes_vert_idx : vertex indices, a boolean vertex mask, or (frame, vertex) index arrays for
+                   (F, Nv) stacks of coordinates
+    return : numpy.ndarray, numpy.ndarray : x and y coordinates of the vertices
+    """
+    if not isinstance(mes_vert_idx, tuple):
+        mes_vert_idx = np.asarray(mes_vert_idx)
+    return np.asarray(vert_px)[mes_vert_idx], np.asarray(vert_py)[mes_vert_idx]
 
 def get_mesectoderm_vertex_indices(num_v, mes_celllist, Vcellneigh):
-    vert_idx = []
-    for i in range(0, num_v):
-        if (Vcellneigh[3 * i] in mes_celllist) or (Vcellneigh[3*i + 1] in mes_celllist) or (Vcellneigh[3*i+2] in mes_celllist):
-            vert_idx.append(i)
-    return vert_idx
+    """
+    mes_celllist : mesectoderm cell indices, or a boolean cell mask; for a stack of frames
+                   (Vcellneigh stacked as (F, 3Nv) or (F, Nv, 3)), an (F, Nc) boolean mask or
+                   the (frame, cell) index arrays of get_mesectoderm_cell_indices
+    return : numpy.ndarray : indices of the vertices of the mesectoderm cells; for stacked
+             frames, the (frame, vertex) index arrays of np.nonzero
+    """
+    Vcellneigh = np.asarray(Vcellneigh)
+    stacked = Vcellneigh.ndim == 3 or (Vcellneigh.ndim == 2 and Vcellneigh.shape[-1] != 3)
+    if isinstance(mes_celllist, tuple):
+        frame_idx, cell_idx = (np.asarray(idx, dtype=np.intp) for idx in mes_celllist)
+        num_cells = max(int(Vcellneigh.max(initial=-1)), int(cell_idx.max(initial=-1))) + 1
+        cell_mask = np.zeros((len(Vcellneigh), num_cells), dtype=bool)
+        cell_mask[frame_idx, cell_idx] = True
+    elif np.asarray(mes_celllist).dtype == bool:
+        cell_mask = np.asarray(mes_celllist)
+    elif stacked:
+        raise ValueError("stacked frames need an (F, Nc) boolean cell mask or (frame, cell) index arrays, "
+                         "not a flat list of cell indices")
+    else:
+        mes_celllist = np.asarray(mes_celllist)
+        cell_mask = np.zeros(max(int(Vcellneigh.max(initial=-1)), int(mes_celllist.max(initial=-1))) + 1, dtype=bool)
+        cell_mask[mes_celllist.astype(np.intp)] = True
+    mask = mesectoderm_vertex_mask(Vcellneigh, cell_mask)[..., :num_v]
+    return np.flatnonzero(mask) if mask.ndim == 1 else np.nonzero(mask)
 
 def get_cell_vertices(cell_num, cell_vertices):
-    ans = []
-    for i in range(len(cell_vertices[0])):
-        if cell_vertices[cell_num][i] != -1:
-            ans.append(cell_vertices[cell_num][i])
-    ans = [int(a) for a in ans]
-    return ans
+    row = np.asarray(cell_vertices[cell_num])
+    return [int(a) for a in row[row != -1]]
 
 def get_vertex_coords(vertex_ind, vposx, vposy):
     if isinstance(vertex_ind, list):
-        xs, ys = [], []
-        for i in range(len(vertex_ind)):
-            xs.append(vposx[vertex_ind[i]])
-            ys.append(vposy[vertex_ind[i]])
-        return xs, ys
+        idx = np.asarray(vertex_ind, dtype=np.intp)
+        return np.asarray(vposx)[idx], np.asarray(vposy)[idx]
     else:
         return vposx[vertex_ind], vposy[vertex_ind]
     
-def draw_mesectoderm_filled(mesectoderm_cell_indices, cell_vertices, vposx, vposy, ax):
-    patches = []
-    if isinstance(mesectoderm_cell_indices, list):
-        for idx in mesectoderm_cell_indices:
-            vertices = get_cell_vertices(idx, cell_vertices)
-            coordsx, coordsy = get_vertex_coords(vertices, vposx, vposy)
-            poly = Polygon(np.c_[coordsx, coordsy], closed=True)
-            patches.append(poly)
-            #ax.fill(coordsx, coordsy, facecolor='lightsalmon')
-    else:
-        vertices = get_cell_vertices(mesectoderm_cell_indices, cell_vertices)
-        coordsx, coordsy = get_vertex_coords(vertices, vposx, vposy)
-        poly = Polygon(np.c_[coordsx, coordsy], closed=True)
-        patches.append(poly)
-        #ax.fill(coordsx, coordsy, facecolor='lightsalmon')
-    p = PatchCollection(patches, alpha=0.4)
-    ax.add_collection(p)
+def get_cell_polygons(pos, cellVer, cellVerNum, box_matrix, cells=None):
+    """
+    Gathers the vertex coordinates of every cell polygon from the padded cellVer array in one
+    pass. Each polygon is unwrapped across the periodic box relative to its first vertex, so
+    cells crossing the box edge come out whole (partly outside the box) instead of as slivers.
+
+    pos : interleaved vertex positions of one frame (or an (Nv, 2) array)
+    cellVer : Nc * 16 padded cell vertex array (or its (Nc, 16) reshape), -1 marks unused slots
+    cellVerNum : Nc array of the number of vertices of each cell
+    box_matrix : BoxMatrix of the frame, or None to leave the polygons as they are
+    cells : optional indices (or boolean mask) of the cells to gather
+    return : numpy.ndarray, numpy.ndarray : (n, 16, 2) polygon coordinates (slots past a
+             cell's vertex count repeat its first vertex) and the (n,) vertex counts
+    """
+    pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+    cell_vertices = np.asarray(cellVer).reshape(-1, 16).astype(np.intp)
+    counts = np.asarray(cellVerNum).reshape(-1).astype(np.intp)
+    if cells is not None:
+        cell_vertices, counts = cell_vertices[cells], counts[cells]
+    valid = np.arange(cell_vertices.shape[1]) < counts[:, None]
+    cell_vertices = np.where(valid, cell_vertices, cell_vertices[:, :1])
+
+    coords = pos[cell_vertices]
+    if box_matrix is None:
+        return coords, counts
+    box = get_box_lengths(box_matrix)
+    offsets = coords - coords[:, :1]
+    offsets -= box * np.round(offsets / box)
+    return coords[:, :1] + offsets, counts
+
+def cell_geometry(pos, cellVer, cellVerNum, box_matrix, cells=None):
+    """
+    Computes the area, perimeter, centroid and shape index (perimeter / sqrt(area)) of every
+    cell of a frame in one pass over the padded (Nc, 16) cell vertex array, with each polygon
+    unwrapped across the periodic box (see get_cell_polygons)
+
+    box_matrix : BoxMatrix of the frame, or None for polygons that need no unwrapping (the
+                 centroids are then not wrapped back into a box either)
+    return : dict : 'area', 'perimeter', 'shape_index' (Nc,) arrays and the (Nc, 2)
+             'centroid' array (wrapped back into the box)
+    """
+    polygons, counts = get_cell_polygons(pos, cellVer, cellVerNum, box_matrix, cells)
+    # the padding slots repeat the first vertex, so they add nothing to the sums below
+    x, y = polygons[..., 0], polygons[..., 1]
+    x_next, y_next = np.roll(x, -1, axis=1), np.roll(y, -1, axis=1)
+    cross = x * y_next - x_next * y
+    signed_area = 0.5 * cross.sum(axis=1)
+    perimeter = np.hypot(x_next - x, y_next - y).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        centroid = np.c_[((x + x_next) * cross).sum(axis=1), ((y + y_next) * cross).sum(axis=1)] / (6 * signed_area[:, None])
+        area = np.abs(signed_area)
+        shape_index = perimeter / np.sqrt(area)
+    if box_matrix is not None:
+        centroid = np.mod(centroid, get_box_lengths(box_matrix))
+    return {'area': area, 'perimeter': perimeter, 'centroid': centroid, 'shape_index': shape_index}
+
+def periodic_copies(polygons, counts, box_matrix, return_index=False):
+    """
+    Appends shifted copies of the unwrapped polygons that stick out of the box, so that their
+    parts are drawn on both sides of the periodic boundary
 
-def find_mesectoderm_boundary(numv, Vneighs, Vcellneighs, cellType, vposx, vposy):
+    return_index : also return, for every output polygon, the index of the input polygon it is a copy of
+    return : numpy.ndarray, numpy.ndarray : the extended polygons and vertex counts
     """
-    get list of vertices along boundary edge
+    box = get_box_lengths(box_matrix)
+    index = np.arange(len(polygons))
+    parts, part_index = [polygons], [index]
+    for axis in (0, 1):
+        shift = np.zeros(2)
+        shift[axis] = box[axis]
+        low = polygons[:, :, axis].min(axis=1) < 0
+        high = polygons[:, :, axis].max(axis=1) > box[axis]
+        parts += [polygons[low] + shift, polygons[high] - shift]
+        part_index += [index[low], index[high]]
+    index = np.concatenate(part_index)
+    if return_index:
+        return np.concatenate(parts), counts[index], index
+    return np.concatenate(parts), counts[index]
+
+def draw_mesectoderm_filled(mesectoderm_cell_indices, cell_vertices, vposx, vposy, ax, cellVerNum=None,
+                            box_matrix=None, values=None, cmap=None, alpha=0.4, **collection_kwargs):
     """
-    Vneighs_trans = np.reshape(Vneighs, (-1, 3))
-    Vcellneighs_trans = np.reshape(Vcellneighs, (-1, 3))
-    mes_ver_list = []
-    mes_lines = []
-    for i in range(numv):
-        curr_v_neighbours = Vneighs_trans[i]
-        curr_v_cellneighs = Vcellneighs_trans[i]
-        for neighbour in curr_v_neighbours:
-            second_v_cellneighs = Vcellneighs_trans[neighbour]
-            common_cell_neighbours = list(set(curr_v_cellneighs).intersection(second_v_cellneighs))
-            #print(common_cell_neighbours)
-            temp_mes_count, temp_non_count = 0, 0
-            # Check if it has 1 mesectoderm
-            '''
-            check if both cells have same mesectoderm neighbour
-            check if both cells have at least 1 mesectoderm and 1 nonmesectoderm neighbour
-            '''
-
-            for cell in common_cell_neighbours:
-                if cellType[cell] == 1:
-                    temp_mes_count += 1
-                else:
-                    temp_non_count += 1
-            
-            if temp_mes_count == 1 and temp_non_count == 1:
+    Fills the given cells with a single PolyCollection. The polygons are gathered in one pass
+    (get_cell_polygons); with box_matrix they are unwrapped across the periodic box and the
+    parts sticking out of the box are also drawn on the other side.
+
+    mesectoderm_cell_indices : cell index, list/array of cell indices, boolean cell mask, or
+                               None for every cell
+    cell_vertices : padded cellVer array of the frame
+    cellVerNum : number of vertices of each cell (counted from the -1 padding if not given)
+    box_matrix : BoxMatrix of the frame (no unwrapping if not given)
+    values : optional (Nc,) per cell values to colour the cells by through cmap, e.g.
+             cellType or cell_geometry(...)['area']
+    return : matplotlib.collections.PolyCollection : the collection added to ax
+    """
+    cell_vertices = np.asarray(cell_vertices).reshape(-1, 16)
+    if cellVerNum is None:
+        cellVerNum = (cell_vertices != -1).sum(axis=1)
+    cells = mesectoderm_cell_indices
+    if cells is None:
+        cells = np.arange(len(cell_vertices))
+    cells = np.atleast_1d(np.asarray(cells))
+    if cells.dtype == bool:
+        cells = np.flatnonzero(cells)
+    polygons, counts = get_cell_polygons(np.c_[np.asarray(vposx, dtype=float), np.asarray(vposy, dtype=float)],
+                                         cell_vertices, cellVerNum, box_matrix, cells=cells)
+    index = np.arange(len(cells))
+    if box_matrix is not None:
+        polygons, counts, index = periodic_copies(polygons, counts, box_matrix, return_index=True)
+
+    # the padding slots repeat the first vertex, so the padded array can be passed whole
+    collection = mc.PolyCollection(polygons, closed=True, alpha=alpha, **collection_kwargs)
+    if values is not None:
+        collection.set_array(np.asarray(values, dtype=float)[cells][index])
+        collection.set_cmap(cmap)
+    ax.add_collection(collection)
+    return collection
+
+def get_unique_edges(Vneighs):
+    """
+    Builds the undirected edge list of a frame from the vertex neighbour array, listing each
+    edge once as a (i, j) pair with i < j
 
-                mes_ver_list.append(i)
-                mes_ver_list.append(neighbour)
-                mes_lines.append([(vposx[i], vposy[i]), (vposx[neighbour], vposy[neighbour])])
-                # TODO: improve efficiency by removing double counting of lines
-    return set(mes_ver_list), mes_lines
+    Vneighs : 3 * Nv array of vertex neighbours (or its (Nv, 3) reshape)
+    return : numpy.ndarray : (E, 2) array of vertex index pairs, sorted by i then j
+    """
+    neighbours = np.asarray(Vneighs).reshape(-1, 3).astype(np.int64)
+    num_v = len(neighbours)
+    sources = np.repeat(np.arange(num_v, dtype=np.int64), 3)
+    targets = neighbours.reshape(-1)
+    keys = np.unique(np.minimum(sources, targets) * num_v + np.maximum(sources, targets))
+    return np.c_[keys // num_v, keys % num_v].astype(np.intp)
+
+def classify_boundary_edges(edges, Vcellneighs, cellType):
+    """
+    Finds which edges lie on the mesectoderm/ectoderm interface: an edge is a boundary edge if
+    the cells shared by its two vertices are exactly one mesectoderm cell (cellType 1) and one
+    other cell
+
+    edges : (E, 2) array of vertex index pairs
+    Vcellneighs : 3 * Nv array of the cell neighbours of each vertex
+    cellType : Nc array of cell types
+    return : numpy.ndarray : (E,) boolean mask of boundary edges
+    """
+    cell_neighbours = np.asarray(Vcellneighs).reshape(-1, 3).astype(np.intp)
+    is_mes = np.asarray(cellType).reshape(-1) == 1
+    first = cell_neighbours[edges[:, 0]]
+    second = cell_neighbours[edges[:, 1]]
+
+    # cells of the first vertex that the second vertex also touches, counting repeats once
+    common = (first[:, :, None] == second[:, None, :]).any(axis=2)
+    common[:, 1] &= first[:, 1] != first[:, 0]
+    common[:, 2] &= (first[:, 2] != first[:, 0]) & (first[:, 2] != first[:, 1])
+
+    mes_count = (common & is_mes[first]).sum(axis=1)
+    non_count = (common & ~is_mes[first]).sum(axis=1)
+    return (mes_count == 1) & (non_count == 1)
+
+def find_boundary_edges(Vneighs, Vcellneighs, cellType):
+    """
+    Finds the mesectoderm/ectoderm interface edges of a frame. This only depends on the
+    topology, so the result can be reused for as long as the topology does not change
+
+    return : numpy.ndarray : (B, 2) array of boundary vertex index pairs (i < j)
+    """
+    edges = get_unique_edges(Vneighs)
+    return edges[classify_boundary_edges(edges, Vcellneighs, cellType)]
+
+def find_mesectoderm_boundary(numv, Vneighs, Vcellneighs, cellType, vposx, vposy, return_edges=False):
+    """
+    get list of vertices along boundary edge
+
+    Each boundary edge is reported once, from its lower vertex index to its higher one.
+
+    numv : number of vertices
+    return : numpy.ndarray, numpy.ndarray : the sorted unique boundary vertex indices, and the
+             (B, 2, 2) array of boundary segments [(x_i, y_i), (x_j, y_j)] (not split at the
+             periodic boundary). If return_edges is set, the (B, 2) vertex index pairs of the
+             segments are returned as well
+    """
+    boundary_edges = find_boundary_edges(np.asarray(Vneighs).reshape(-1)[:3 * numv], Vcellneighs, cellType)
+    pos = np.c_[np.asarray(vposx, dtype=float), np.asarray(vposy, dtype=float)]
+    mes_lines = pos[boundary_edges]
+    mes_ver_list = np.unique(boundary_edges)
+    if return_edges:
+        return mes_ver_list, mes_lines, boundary_edges
+    return mes_ver_list, mes_lines
             
-def draw_line(p1, p2, colour, ax):
+class BoundaryTracker(object):
     """
-    draws a line given two coordinate tuples, following the periodic boundary conditions
+    Tracks the mesectoderm boundary edges across consecutive frames. The boundary edge set of
+    the previous frame is kept; a new frame's Vneighs, VertexCellNeighbors and cellType are
+    diffed against the previous ones, and only the edges touching vertices whose neighbours or
+    neighbouring cells (or their types) changed are reclassified. Segment coordinates are then
+    gathered from the new positions by index. A frame with a different number of vertices or
+    cells is processed from scratch.
     """
-    global box_side_len
-    line = []
-    point_diff = np.subtract(np.asarray(p1), np.asarray(p2))
-    if np.linalg.norm(point_diff) < box_side_len/2:
-        line.append([p1, p2]);
-    else:
-        if point_diff[0] > box_side_len/2:
-            point_diff[0] -= box_side_len
-        if point_diff[0] < -box_side_len/2:
-            point_diff[0] += box_side_len
-        if point_diff[1] > box_side_len/2:
-            point_diff[1] -= box_side_len
-        if point_diff[1] < -box_side_len/2:
-            point_diff[1] += box_side_len
-        line.append([p1, tuple_sub(p1, point_diff)])
-        line.append([p2, tuple_add(p2, point_diff)])
-    
+    def __init__(self):
+        self.neighbours = None
+        self.cell_neighbours = None
+        self.is_mes = None
+        self.keys = None        # sorted i * Nv + j keys of the boundary edges (i < j)
+
+    def _classify_vertices(self, vertices):
+        """return : numpy.ndarray : sorted keys of the boundary edges touching the given vertices"""
+        num_v = len(self.neighbours)
+        sources = np.repeat(vertices, 3)
+        targets = self.neighbours[vertices].reshape(-1)
+        keys = np.unique(np.minimum(sources, targets) * num_v + np.maximum(sources, targets))
+        edges = np.c_[keys // num_v, keys % num_v]
+        return keys[classify_boundary_edges(edges, self.cell_neighbours, self.is_mes)]
+
+    def update(self, Vneighs, Vcellneighs, cellType):
+        """
+        Updates the boundary edge set to a new frame's topology
+
+        return : numpy.ndarray : (B, 2) boundary vertex index pairs (i < j), sorted
+        """
+        neighbours = np.asarray(Vneighs).reshape(-1, 3).astype(np.intp, copy=False)
+        cell_neighbours = np.asarray(Vcellneighs).reshape(-1, 3).astype(np.intp, copy=False)
+        is_mes = np.asarray(cellType).reshape(-1) == 1
+        num_v = len(neighbours)
+
+        if (self.keys is None or self.neighbours.shape != neighbours.shape
+                or self.cell_neighbours.shape != cell_neighbours.shape or self.is_mes.shape != is_mes.shape):
+            self.neighbours, self.cell_neighbours, self.is_mes = neighbours, cell_neighbours, is_mes
+            self.keys = self._classify_vertices(np.arange(num_v))
+        else:
+            changed = (neighbours != self.neighbours).any(axis=1) | (cell_neighbours != self.cell_neighbours).any(axis=1)
+            changed_cells = np.flatnonzero(is_mes != self.is_mes)
+            if len(changed_cells):
+                changed |= np.isin(cell_neighbours, changed_cells).any(axis=1)
+            self.neighbours, self.cell_neighbours, self.is_mes = neighbours, cell_neighbours, is_mes
+            vertices = np.flatnonzero(changed)
+            if len(vertices):
+                # drop the old edges of the changed vertices, then reclassify their new edges
+                untouched = ~(changed[self.keys // num_v] | changed[self.keys % num_v])
+                self.keys = np.union1d(self.keys[untouched], self._classify_vertices(vertices))
+        return np.c_[self.keys // num_v, self.keys % num_v]
+
+    def find_boundary(self, Vneighs, Vcellneighs, cellType, vposx, vposy):
+        """
+        Incremental counterpart of find_mesectoderm_boundary
+
+        return : numpy.ndarray, numpy.ndarray, numpy.ndarray : the unique boundary vertex
+                 indices, the (B, 2, 2) boundary segments and the (B, 2) boundary edges
+        """
+        boundary_edges = self.update(Vneighs, Vcellneighs, cellType)
+        pos = np.c_[np.asarray(vposx, dtype=float), np.asarray(vposy, dtype=float)]
+        return np.unique(boundary_edges), pos[boundary_edges], boundary_edges
+
+def draw_line(p1, p2, colour, ax, box_len):
+    """
+    draws a line given two coordinate tuples, following the periodic boundary conditions of a
+    box of side box_len
+    """
+    line = periodic_segments(p1, p2, box_len)
     lc = mc.LineCollection(line, linewidths=1, colors=colors.to_rgba(colour))
     ax.add_collection(lc)
 
+def render_boundary_image(mes_lines, box_len, axis_window=(0, 20, 8, 12)):
+    """
+    Renders the mesectoderm boundary lines inside the axis window in memory, on this process's
+    reusable render.LineCanvas
+
+    return : numpy.ndarray : (height, width, 3) uint8 BGR image, ready for sweeper
+    """
+    mes_lines = np.asarray(mes_lines, dtype=float).reshape(-1, 2, 2)
+    segments = periodic_segments(mes_lines[:, 0], mes_lines[:, 1], box_len)
+    return render.get_canvas(axis_window=axis_window).render(segments)
+
+def write_image(filename, image):
+    """
+    Saves an image with cv2.imwrite, which only reports failure (missing directory, unknown
+    extension, full disk) through its return value
+
+    return : none
+    """
+    if not cv2.imwrite(filename, image):
+        raise IOError("could not write image {}".format(filename))
+
+def save_boundary_image(mes_lines, box_len, filename, axis_window=(0, 20, 8, 12)):
+    """
+    Draws the mesectoderm boundary lines inside the axis window and saves the image with no
+    axes or padding, as read back by sweeper
+
+    return : numpy.ndarray : the rendered BGR image
+    """
+    image = render_boundary_image(mes_lines, box_len, axis_window)
+    write_image(filename, image)
+    return image
+
+def boundary_curves_from_lines(mes_lines, box_len, axis_window=(0, 20, 8, 12), num_bins=500):
+    """
+    Computes the upper and lower mesectoderm boundary curves directly from the boundary lines
+    (in simulation coordinates), without rendering an image. The x range of the axis window is
+    split into num_bins bins; each boundary segment is sampled at the bin centres it spans (and
+    at its endpoints), and the upper/lower curve takes the highest/lowest sample in each bin.
+    Samples outside the y range of the window are dropped, like the clipping of the rendered
+    image. Empty bins are linearly interpolated from their filled neighbours.
+
+    Unlike sweeper, the curves are in simulation units with y pointing up, so the upper curve
+    has the larger y values.
+
+    return : numpy.ndarray, numpy.ndarray : (num_bins, 2) arrays of [x, y] points of the upper
+             and lower boundary
+    """
+    x0, x1, y0, y1 = axis_window
+    bin_width = (x1 - x0) / num_bins
+    centres = x0 + (np.arange(num_bins) + 0.5) * bin_width
+    lines = np.asarray(mes_lines, dtype=float).reshape(-1, 2, 2)
+    segments = periodic_segments(lines[:, 0], lines[:, 1], box_len)
+
+    # sample every segment at the bin centres it spans
+    order = np.argsort(segments[:, :, 0], axis=1)
+    left = np.take_along_axis(segments, order[:, :, None], axis=1)[:, 0]
+    right = np.take_along_axis(segments, order[:, :, None], axis=1)[:, 1]
+    first_bin = np.ceil((left[:, 0] - x0) / bin_width - 0.5).astype(int).clip(0, num_bins)
+    last_bin = np.floor((right[:, 0] - x0) / bin_width - 0.5).astype(int).clip(-1, num_bins - 1)
+    counts = np.maximum(last_bin - first_bin + 1, 0)
+    seg_idx = np.repeat(np.arange(len(segments)), counts)
+    bins = first_bin[seg_idx] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    span = right[seg_idx, 0] - left[seg_idx, 0]
+    t = np.divide(centres[bins] - left[seg_idx, 0], span, out=np.zeros_like(span), where=span > 0)
+    ys = left[seg_idx, 1] + t * (right[seg_idx, 1] - left[seg_idx, 1])
+
+    # the endpoints cover segments too short (or too steep) to span a bin centre
+    ends = segments.reshape(-1, 2)
+    end_bins = np.floor((ends[:, 0] - x0) / bin_width).astype(int)
+    inside = (end_bins >= 0) & (end_bins < num_bins)
+    bins = np.concatenate([bins, end_bins[inside]])
+    ys = np.concatenate([ys, ends[inside, 1]])
+
+    keep = (ys >= y0) & (ys <= y1)
+    bins, ys = bins[keep], ys[keep]
+    if len(bins) == 0:
+        raise NoBoundaryError("no mesectoderm boundary inside the axis window")
+
+    upper = np.full(num_bins, -np.inf)
+    lower = np.full(num_bins, np.inf)
+    np.maximum.at(upper, bins, ys)
+    np.minimum.at(lower, bins, ys)
+    filled = np.isfinite(upper)
+    upper = np.interp(centres, centres[filled], upper[filled])
+    lower = np.interp(centres, centres[filled], lower[filled])
+    return np.c_[centres, upper], np.c_[centres, lower]
+
 
 def draw_mesectoderm_vertices(vposx, vposy, mes_vertices, ax):
-    x = [vposx[a] for a in mes_vertices]
-    y = [vposy[a] for a in mes_vertices]
+    x, y = get_mesectoderm_vertex_coords(mes_vertices, vposx, vposy)
     ax.scatter(x, y, c="tab:green", s=0.1)
     return x, y
 
@@ -268,280 +637,168 @@ def convert_pixel_to_coord(row, col):
 
 def sweeper(img_path):
     """
-    sweeper takes in an image and returns lists of pixels corresponding to the top/bottom boundary of the mesectoderm
+    sweeper takes in an image and returns the pixels corresponding to the top/bottom boundary of the mesectoderm
+
+    img_path : path of the image, or the image itself as a BGR or grayscale array
+    return : numpy.ndarray, numpy.ndarray : (width, 2) arrays of [column, row] points of the upper and lower boundary
     """
-    im = cv2.imread(img_path)
-    im_gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
+    im = cv2.imread(img_path) if isinstance(img_path, str) else np.asarray(img_path)
+    im_gray = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY) if im.ndim == 3 else im
     th, im_gray_th = cv2.threshold(im_gray, 127, 255, cv2.THRESH_BINARY)
-    height, width = im_gray_th.shape
-    upper_boundary = []
-    lower_boundary = []
-
-    for i in range(width):
-        column = []
-        for j in range(height):
-            # found pixel
-            #print(im_gray_th[j])
-            if im_gray_th[j][i] == 0:   # TODO: change this to actual y value
-                column.append([i, j])
-
-        # post process column by taking the first half as upper mes, second half as lower mes  
-        # THIS METHOD DOES NOT WORK... WILL INSTEAD TAKE TOPMOST POINT AND BOTTOMMOST POINT      
-        #upper = np.average(column[:len(column)//2], axis=1)
-        #lower = np.average(column[len(column)//2:], axis=1)
-        if len(column) == 0:
-            '''
-                If the column is empty, then we want to use an interpolated function. 
-                On the first pass, we can insert a 0 for now so that we can search and replace later.
-            '''
-            lower_boundary.append(0)
-            upper_boundary.append(0)
-        else:
-            upper = column[0]
-            lower = column[-1]
-            upper_boundary.append(upper)  # list of points, i'th list contains all points corresponding to the i'th column in the image
-            lower_boundary.append(lower)
+    return sweep_boundary(im_gray_th == 0)
 
+def sweep_boundary(foreground):
+    """
+    Finds the topmost and bottommost foreground pixel of every column of a boolean image.
+    Columns without any foreground pixel are filled by linear interpolation between the nearest
+    filled columns on either side (or copy the nearest filled column at the left/right edges)
 
-    #cv2.imwrite('otsu.jpg', im_gray_th)
-    '''
-    Interpolate missing columns by:
-        get previous filled column point
-        get next filled column point
-        find the slope between the two points
-        add one slope to the previous point, and treat that as your new point
-        TODO: make the case for where the empty column occurs before any existing column 
-                i.e. on the LHS of the screen - in that case, just use the future step as the main one.
-                currently crashes on image 96 of sample pid 1
-    '''
-    if upper_boundary[0] == 0:
-        future = []
-        for i in range(width):
-            if upper_boundary[i] != 0:
-                future = upper_boundary[i]
-                break
-        upper_boundary[0] = future
-    if lower_boundary[0] == 0:
-        future = []
-        for i in range(width):
-            if lower_boundary[i] != 0:
-                future = lower_boundary[i]
-                break
-        lower_boundary[0] = future
-    
-    for i in range(width):
-        if upper_boundary[i] == 0:
-            future = []
-            if i != 0: previous = upper_boundary[i-1] 
-            else: previous = upper_boundary[0]
-
-            for j in range(i, width):
-                if upper_boundary[j] != 0:
-                    future = upper_boundary[j]
-                    break
-            if len(future) == 0:    # unable to find a future point
-                upper_boundary[i] = previous
-            else:
-                if future == previous:
-                    upper_boundary[i] = previous
-                else:
-                    #print("future point: {}, previous point: {}".format(future, previous))
-                    upper_boundary[i] = [i, previous[1] + (future[1]-previous[1])/(future[0]-previous[0])]
-        if lower_boundary[i] == 0:
-            future = []
-            if i != 0: previous = lower_boundary[i-1] 
-            else: previous = lower_boundary[0]
-
-            for j in range(i, width):
-                if lower_boundary[j] != 0:
-                    future = lower_boundary[j]
-                    break
-            if len(future) == 0:    # unable to find a future point
-                lower_boundary[i] = previous
-            else:
-                if future == previous:
-                    lower_boundary[i] = previous
-                else:
-                    lower_boundary[i] = [i, previous[1] + (future[1]-previous[1])/(future[0]-previous[0])]
-        
-    return upper_boundary, lower_boundary
+    foreground : (height, width) boolean array
+    return : numpy.ndarray, numpy.ndarray : (width, 2) arrays of [column, row] points of the upper and lower boundary
+    """
+    height, width = foreground.shape
+    filled = foreground.any(axis=0)
+    if not filled.any():
+        raise NoBoundaryError("no boundary pixels found in the image")
+    columns = np.arange(width)
+    upper = foreground.argmax(axis=0).astype(float)
+    lower = (height - 1 - foreground[::-1].argmax(axis=0)).astype(float)
+    if not filled.all():
+        upper = np.interp(columns, columns[filled], upper[filled])
+        lower = np.interp(columns, columns[filled], lower[filled])
+    return np.c_[columns, upper], np.c_[columns, lower]
     
-def step_func(val):
-    """Helper step function for mesectoderm internalization calculation"""
-    return 1 if val <= 3 else 0
+def step_func(val, threshold=3):
+    """Helper step function for mesectoderm internalization calculation (works elementwise on arrays)"""
+    return (np.asarray(val) <= threshold).astype(int)
 
 def calc_pixel_widths(upper_tuple_list, lower_tuple_list, width):
-    """Calculates the pixel widths between the top list and bottom list"""
-    distances = []
-    for i in range(width):
-        mean_top = np.mean(upper_tuple_list[i])
-        mean_bot = np.mean(lower_tuple_list[i])
-        distances.append(mean_top-mean_bot)
-    
-    return distances
+    """
+    Calculates the pixel widths between the top list and bottom list (the difference of the
+    means of each column's points), for the first width columns of one (W, 2) frame or of an
+    (F, W, 2) stack of frames. See metrics.width_profile for widths in physical units
+
+    return : numpy.ndarray : (width,) or (F, width) widths
+    """
+    upper = np.asarray(upper_tuple_list, dtype=float)[..., :width, :]
+    lower = np.asarray(lower_tuple_list, dtype=float)[..., :width, :]
+    return upper.mean(axis=-1) - lower.mean(axis=-1)
 
 def calc_roughness(rotated_points, segment_size):
     """
     Calculates roughness equation from this paper: https://www.sciencedirect.com/science/article/pii/S2667290121000553 
-    return : the mean roughness value over the entire rotated boundary over all segmnets    
-    """
-    num_segments = len(rotated_points)//segment_size
-    xaxis = rotated_points[0][1]    # takes the y value (idx = 1) of the first coordinate point 
-    roughnesses = []
-    for i in range(num_segments):
-        segment = rotated_points[i*segment_size:(i+1)*segment_size]
-        h_tot = 0
-        for j in range(segment_size):
-            h_tot += np.abs(segment[j][1] - xaxis)   # difference in y value
-        h_bar = h_tot / segment_size
-        temp = 0
-        for j in range(segment_size):
-            h_i = np.abs(segment[j][1] - xaxis)      # difference in y value
-            temp += np.power(h_i-h_bar, 2)
-        w2 = temp/segment_size
-        roughnesses.append(np.sqrt(w2))
-
-    return np.mean(roughnesses)
-    
-def calc_mes_internalization(upper_list, lower_list):
-    """Calculates rate of mesectoderm internalization given the upper and bottom mesectoderm points"""
-    distances = np.delete(np.subtract(upper_list, lower_list), 0, 1)
-    s = [step_func(x) for x in distances]
-    ans = np.sum(s)/len(upper_list)
-    return ans
-
-def rotate_points(upper_points_list, bottom_points_list, N):
-    """ Rotates a given set of points to align each with its own axis"""
-    top_left = upper_points_list[0]
-    top_right = upper_points_list[-1]
-    bot_left = bottom_points_list[0]
-    bot_right = bottom_points_list[-1]
-   
-    #print(top_left[0], top_left[1], top_right[0], top_right[1])
-    slope_top = (top_right[1] - top_left[1])/(top_right[0] - top_left[0])
-    #print(slope_top)
-    slope_bot = (bot_right[1] - bot_left[1])/(bot_right[0] - bot_left[0])
-    theta_r_top = np.arctan(slope_top)
-    theta_r_bot = np.arctan(slope_bot)
-    if slope_top < 0:
-        theta_r_top = - theta_r_top
-    if slope_bot < 0:
-        theta_r_bot = - theta_r_bot
-    Rt = [[np.cos(theta_r_top), -np.sin(theta_r_top)], 
-         [np.sin(theta_r_top), np.cos(theta_r_top)]]
-    Rb = [[np.cos(theta_r_bot), -np.sin(theta_r_bot)], 
-         [np.sin(theta_r_bot), np.cos(theta_r_bot)]]
-    
-    for i in range(len(upper_points_list)):
-        upper_points_list[i] = np.matmul(Rt, upper_points_list[i])
-    
-    for i in range(len(bottom_points_list)):
-        bottom_points_list[i] = np.matmul(Rb, bottom_points_list[i])
+    The heights are the distances of the y values from the y value of the first point.
 
-    return upper_points_list, bottom_points_list
+    rotated_points : (N, 2) array of rotated boundary points, or an (F, N, 2) stack of frames
+    segment_size : segment length, or a list of segment lengths
+    return : the mean roughness value over the entire rotated boundary over all segmnets
+             (see roughness_scaling for the shape with stacks of frames / several lengths)
+    """
+    points = np.asarray(rotated_points, dtype=float)
+    heights = np.abs(points[..., 1] - points[..., :1, 1])
+    return roughness_scaling(heights, segment_size)
 
-if __name__ == "__main__":
-    num_it = 0
-    fn = read_files("..\celldiv2.8-FIG4DATA\SLOWcelldivON\cellGPU_mesectoderm-ectoderm_02082021\data\*.nc")
-
-    roughness_graph = []
-    read_table = [1, 1, 0, 0, 0, 0, 0, 0, 0, 0]
-    for i in range(0, len(read_table)):
-        if read_table[i] == 1 and i == 0:
-            roughness_graph = np.append([roughness_graph], np.array([np.genfromtxt('roughness_graph_' + str(10) + '.csv', delimiter=',')]).T)
-            for j in range(0, 120):
-                k = fn.popitem(False)
-                if j == 0 : print(k[0][-20:-1])
-            #print(roughness_graph)
-
-        elif read_table[i] == 1 and i != 0:
-            roughness_graph = np.append([roughness_graph], np.genfromtxt('roughness_graph_' + str(i) + '.csv', delimiter=',').T)
-            for j in range(0, 120):
-                k = fn.popitem(False)
-                if j == 0 : print(k[0][-20:-1])
+def roughness_scaling(heights, segment_sizes):
+    """
+    Computes the interface width w(L) of one or more height profiles for one or more segment
+    lengths L: each profile is cut into consecutive segments of L points (leftover points at
+    the end are dropped), w is the standard deviation of the heights within a segment, and
+    w(L) is its mean over the segments. Segment sums come from cumulative sums of h and h^2,
+    so every extra length costs O(N).
+
+    heights : (N,) height profile, or (F, N) stack of profiles (e.g. all frames of a run)
+    segment_sizes : segment length, or a list of segment lengths
+    return : numpy.ndarray : w(L) with shape (F, number of lengths); the frame axis is dropped for
+             a single profile and the length axis for a single length. Lengths longer than the
+             profile give nan
+    """
+    h = np.asarray(heights, dtype=float)
+    single_frame = h.ndim == 1
+    h = np.atleast_2d(h)
+    h = h - h.mean(axis=1, keepdims=True)   # w is shift invariant; centring keeps the sums accurate
+    num_frames, num_points = h.shape
+    sums = np.zeros((num_frames, num_points + 1))
+    square_sums = np.zeros((num_frames, num_points + 1))
+    np.cumsum(h, axis=1, out=sums[:, 1:])
+    np.cumsum(h * h, axis=1, out=square_sums[:, 1:])
+
+    sizes = np.atleast_1d(segment_sizes).astype(int)
+    widths = np.full((num_frames, len(sizes)), np.nan)
+    for k, size in enumerate(sizes):
+        num_segments = num_points // size
+        if num_segments == 0:
+            continue
+        bounds = np.arange(num_segments + 1) * size
+        mean = np.diff(sums[:, bounds], axis=1) / size
+        mean_square = np.diff(square_sums[:, bounds], axis=1) / size
+        widths[:, k] = np.sqrt(np.maximum(mean_square - mean * mean, 0)).mean(axis=1)
+
+    if np.ndim(segment_sizes) == 0:
+        widths = widths[:, 0]
+    return widths[0] if single_frame else widths
     
-    if read_table[0] == 1:
-        roughness_graph = np.reshape(roughness_graph, (-1, 120))    
-        print(roughness_graph.shape)
-    for j in range(2, 4):
-        pid_rough = []
-        pid_name = ""
-        for i in range(0, 120):
-            frame = fn.popitem(False)
-            if i == 0 : print(frame[0][-20:-1])
-            pid_name = frame[0][-20:-14]
-            print(i)
-            ds = frame[1]       # fn.popitem(False) returns a (key, value) pair of the first element (FIFO order). [1] grabs the values
-            num_cell = ds.dimensions['Nc'].size
-            num_v = ds.dimensions['Nv'].size
-            
-            VCellNeighs = ds.variables['VertexCellNeighbors'][:][0] # size of 3 * num_v : groups of 3 (3 cell neighbours for each vertex)
-            cellVertices = np.reshape(ds.variables['cellVer'][:][0], (-1, 16))  # 2D array: i-th row has the list of vertex indices of the i-th cell 
-            cellVerNum = ds.variables['cellVerNum'][:]
-            Vneighs = ds.variables['Vneighs'][:] 
-            num_edge = Vneighs.shape[1]
-            vpos = ds.variables['pos'][:]
-            vpos_x = vpos[num_it][::2]
-            vpos_y = vpos[num_it][1::2]
-            cell_pos = ds['cellPositions'][:] 
-            cell_types = ds['cellType'][num_it]
-            box_side_len = ds.variables['BoxMatrix'][0][0]
-            curr = 0
-            fig, ax = plt.subplots()
-
-            #print(len(cell_types))
-            #print(num_cell)
-            ''' Get Processed Data '''
-            #mesectoderm_cells = get_mesectoderm_cell_indices(numcell=num_cell, celltypelist=cell_types)
-            #mesectoderm_vertices = get_mesectoderm_vertex_indices(num_v, mesectoderm_cells, VCellNeighs) 
-            mesectoderm_boundary_vertices, mesectoderm_boundary_lines = find_mesectoderm_boundary(num_v, Vneighs, VCellNeighs, cell_types, vpos_x, vpos_y)
-            #mesectoderm_vertex_coords_x , mesectoderm_vertex_coords_y = get_mesectoderm_vertex_coords(mesectoderm_vertices, vpos_x, vpos_y, ax)
-
-
-            #t1x, t1y, t2x, t2y = seperate_celltype(cell_pos[num_it], ds.variables['cellType'][num_it])
-            
+def calc_mes_internalization(upper_list, lower_list, threshold=3):
+    """
+    Calculates rate of mesectoderm internalization given the upper and bottom mesectoderm
+    points: the fraction of columns whose signed distance upper - lower is at most threshold.
+    Takes one (W, 2) frame or an (F, W, 2) stack of frames; see metrics.internalization for
+    the unsigned, physical unit version
 
-            #draw_frame(0)   ## TODO: Edit parameters to draw the frame, added globals inside params
-        
-            #bcoords_x, bcoords_y = draw_mesectoderm_vertices(vpos_x, vpos_y, mesectoderm_boundary_vertices, ax)    # ALSO DRAWS THE BOUNDARY
-            plt.axis([0, 20, 8, 12])
-            for lines in mesectoderm_boundary_lines:
-                draw_line(lines[0], lines[1], 'tab:green', ax)
-            
-            plt.axis('off')
-            ax.get_xaxis().set_visible(False)
-            ax.get_yaxis().set_visible(False)
-
-            #plt.show()
-            #print(frame[0][-20:-3])
-            filename = '../frame_images/{fname}.png'.format(fname = frame[0][-20:-3])
-            plt.savefig(filename, bbox_inches='tight', pad_inches=0)
-            plt.close('all')
-            upperboundary, lowerboundary = sweeper(filename)
-            r_upper_boundary, r_lower_boundary = rotate_points(upper_points_list=upperboundary, bottom_points_list=lowerboundary, N=1)
-            #print(r_upper_boundary[0:40])
-            roughness_of_timeframe = calc_roughness(r_upper_boundary, 150)
-            pid_rough.append(roughness_of_timeframe)
-            ##print(roughness)
-        if len(roughness_graph) == 0: 
-            roughness_graph = [pid_rough]
-        else:
-            np.concatenate((roughness_graph, [pid_rough]), axis=0)
-            print(roughness_graph.shape)
-        
-        name = j if j != 0 else 10
-        np.savetxt("roughness_graph_" + str(name) + ".csv", pid_rough, delimiter=",")
+    return : float or numpy.ndarray : the rate of each frame
+    """
+    distances = np.subtract(upper_list, lower_list)[..., 1]
+    return np.mean(distances <= threshold, axis=-1)
 
-        print("pid {j} done".format(j=name))
+def alignment_angles(points, method='endpoints'):
+    """
+    Finds the angle of the line each boundary is aligned to
 
-    #convert_img_to_mov('../frame_images/', '../videos/test_1.avi')
-    
-    roughness_plot = np.mean(roughness_graph, 0)
-    
-    fig = plt.figure()
-    plt.plot(np.linspace(1, 120, 120), roughness_plot, 'o')
-    plt.savefig('../roughness_graph_SLOW.png', bbox_inches='tight', pad_inches=0)
-    plt.show()
+    points : (N, 2) boundary points, or an (F, N, 2) stack of boundaries
+    method : 'endpoints' for the line through the first and last point, or 'fit' for the
+             least squares (principal axis) line through all points
+    return : numpy.ndarray : the angle of each boundary in radians (0-d for a single boundary)
+    """
+    points = np.asarray(points, dtype=float)
+    if method == 'endpoints':
+        delta = points[..., -1, :] - points[..., 0, :]
+        return np.arctan2(delta[..., 1], delta[..., 0])
+    if method == 'fit':
+        centred = points - points.mean(axis=-2, keepdims=True)
+        var_x = (centred[..., 0] ** 2).mean(axis=-1)
+        var_y = (centred[..., 1] ** 2).mean(axis=-1)
+        cov_xy = (centred[..., 0] * centred[..., 1]).mean(axis=-1)
+        return 0.5 * np.arctan2(2 * cov_xy, var_x - var_y)
+    raise ValueError("unknown alignment method: {}".format(method))
+
+def align_points(points, method='endpoints'):
+    """
+    Rotates boundaries about the origin so that their alignment line (see alignment_angles)
+    is parallel to the x axis, with a single matrix product for the whole stack
+
+    points : (N, 2) boundary points, or an (F, N, 2) stack of boundaries
+    return : numpy.ndarray : rotated copy of the points (the input is not modified)
+    """
+    points = np.asarray(points, dtype=float)
+    theta = alignment_angles(points, method)
+    cos, sin = np.cos(theta), np.sin(theta)
+    # transpose of the rotation by -theta, for row vectors
+    rotation_t = np.stack([np.stack([cos, -sin], axis=-1), np.stack([sin, cos], axis=-1)], axis=-2)
+    return np.matmul(points, rotation_t)
+
+def rotate_points(upper_points_list, bottom_points_list, N=None, method='endpoints'):
+    """ Rotates a given set of points to align each with its own axis
+
+    Both boundaries may be (N, 2) arrays or (F, N, 2) stacks; they are rotated independently
+    and the inputs are left unchanged. N is unused and only kept for existing callers.
+
+    return : numpy.ndarray, numpy.ndarray : the rotated upper and bottom points
+    """
+    return align_points(upper_points_list, method), align_points(bottom_points_list, method)
+
+if __name__ == "__main__":
+    # the per-pid roughness sweep lives in batch.py: python batch.py "<glob of nc files>" --workers N
+    import batch
+    batch.main()
     '''
         TODO: 
         1. fix bug with memory 
@@ -0,0 +1,205 @@
+import argparse
+import os
+from collections import OrderedDict
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+import batch
+import cache
+import frames
+import metrics
+import store
+import video
+
+# stages in the order they run, with the stages each one needs
+STAGES = OrderedDict([('boundary', ()), ('sweep', ('boundary',)), ('roughness', ('sweep',)),
+                      ('internalization', ('sweep',)), ('render', ('boundary',)), ('movie', ())])
+
+EXAMPLE_CONFIG = '''\
+# python vertexproc.py run config.toml
+# relative paths are relative to this file
+
+[input]
+pattern = "data/*.nc"           # glob of the nc frame files
+# runs = ["test_p1", "test_p2"] # run ids (file name before the timestep) to process (default: all)
+# frames = [0, 100]             # [start, stop) frames of each run (default: all)
+
+[run]
+workers = 4                     # worker processes (default: cpu count)
+chunksize = 1                   # frames handed to a worker at a time
+# prefetch = 4                  # analyse in one process, reading frames ahead on an I/O thread
+resume = true                   # skip frames the store holds from the same stages and parameters
+# cache_dir = "cache"           # per-frame cache of boundaries, curves and metrics
+# cache_size_mb = 1024
+# profile = "profile.jsonl"     # per-stage time and memory log
+# trace_memory = false
+
+[output]
+store = "results.nc"            # NetCDF results store (always written)
+# csv = "results.csv"           # also export the store as CSV
+# plot = "roughness.png"        # mean roughness over runs against frame
+
+# only the stages listed here run, plus the stages they need
+[stages.boundary]
+
+[stages.sweep]
+mode = "geometry"               # or "image" (render the boundary and sweep the pixels)
+axis_window = [0, 20, 8, 12]
+
+[stages.roughness]
+# segment_length = 6.05         # roughness segment length, simulation units (default: 150 pixels of the default image)
+
+[stages.internalization]
+# threshold = 0.0325            # width (simulation units) counted as internalized (default: 3 pixels of the default image)
+
+# [stages.render]               # save the rendered boundary of every frame
+# image_dir = "frame_images"
+
+# [stages.movie]                # one video of the tissue per run
+# video = "movies/{run}.mp4"
+# fps = 24
+# size = [1024, 1024]
+# fill_mesectoderm = true
+'''
+
+def load_config(path):
+    """
+    Reads a TOML pipeline configuration and resolves its relative paths against the directory
+    of the file
+
+    return : dict : the configuration
+    """
+    if tomllib is None:
+        raise ImportError("reading the configuration needs python 3.11+ (tomllib) or the tomli package")
+    with open(path, 'rb') as f:
+        config = tomllib.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    resolve = lambda value: value if value is None else os.path.join(base, value)
+    for section, key in [('input', 'pattern'), ('run', 'cache_dir'), ('run', 'profile'), ('output', 'store'),
+                         ('output', 'csv'), ('output', 'plot'), ('stages.render', 'image_dir'),
+                         ('stages.movie', 'video')]:
+        table = config
+        for name in section.split('.'):
+            table = table.get(name, {})
+        if key in table:
+            table[key] = resolve(table[key])
+    return config
+
+def resolve_stages(requested):
+    """
+    Adds the stages the requested stages depend on
+
+    return : list : the stages to run, in STAGES order
+    """
+    unknown = set(requested) - set(STAGES)
+    if unknown:
+        raise ValueError("unknown stages: {} (known stages: {})".format(', '.join(sorted(unknown)), ', '.join(STAGES)))
+    needed = set()
+    pending = list(requested)
+    while pending:
+        stage = pending.pop()
+        if stage not in needed:
+            needed.add(stage)
+            pending.extend(STAGES[stage])
+    return [stage for stage in STAGES if stage in needed]
+
+def check_config(config):
+    """
+    Checks the settings of a configuration that cannot be checked by its TOML syntax
+
+    return : list : the stages to run (see resolve_stages)
+    """
+    stage_params = config.get('stages', {})
+    stages = resolve_stages(stage_params)
+    if 'pattern' not in config.get('input', {}):
+        raise ValueError("the configuration has no [input] pattern")
+    if stage_params.get('sweep', {}).get('mode', 'geometry') not in ('geometry', 'image'):
+        raise ValueError("[stages.sweep] mode must be 'geometry' or 'image'")
+    if 'segment_size' in stage_params.get('roughness', {}):
+        raise ValueError("[stages.roughness] segment_size (points) was replaced by segment_length (simulation units)")
+    return stages
+
+def run_pipeline(config):
+    """
+    Runs the stages of a configuration: the per-frame analysis stages through batch.run_batch
+    (passing the boundary, curves and metrics of a frame from stage to stage in memory), then
+    the exports and the movies
+
+    return : list : the stages that ran
+    """
+    inputs, run, output = config.get('input', {}), config.get('run', {}), config.get('output', {})
+    stage_params = config.get('stages', {})
+    stages = check_config(config)
+    runs = inputs.get('runs')
+    frame_range = tuple(inputs.get('frames', (0, None)))
+    store_path = output.get('store', 'results.nc')
+
+    analysis = [stage for stage in stages if stage in batch.STAGES]
+    if analysis:
+        sweep = stage_params.get('sweep', {})
+        image_dir = stage_params.get('render', {}).get('image_dir') if 'render' in stages else None
+        batch.run_batch(inputs['pattern'], store_path=store_path, workers=run.get('workers'),
+                        chunksize=run.get('chunksize', 1), frame_range=frame_range, resume=run.get('resume', True),
+                        runs=runs, prefetch=run.get('prefetch'), stages=analysis,
+                        segment_length=stage_params.get('roughness', {}).get('segment_length',
+                                                                             metrics.DEFAULT_SEGMENT_LENGTH),
+                        threshold=stage_params.get('internalization', {}).get('threshold', metrics.DEFAULT_THRESHOLD),
+                        axis_window=tuple(sweep.get('axis_window', (0, 20, 8, 12))),
+                        boundary_mode=sweep.get('mode', 'geometry'), image_dir=image_dir,
+                        cache_dir=run.get('cache_dir'),
+                        cache_size=int(run.get('cache_size_mb', cache.DEFAULT_MAX_BYTES / 2**20) * 2**20),
+                        profile_log=run.get('profile'), trace_memory=run.get('trace_memory', False))
+        if output.get('csv'):
+            with store.ResultsStore(store_path) as results:
+                results.to_csv(output['csv'])
+        if output.get('plot') and 'roughness' in stages:
+            batch.plot_roughness(store_path, output['plot'])
+
+    if 'movie' in stages:
+        movie = dict(stage_params['movie'])
+        video_template = movie.pop('video', '{run}.mp4')
+        fps, codec = movie.pop('fps', 24), movie.pop('codec', 'mp4v')
+        if 'size' in movie:
+            movie['size'] = tuple(movie['size'])
+        for run_id, paths in frames.discover_runs(inputs['pattern']).items():
+            if runs is not None and run_id not in runs:
+                continue
+            sources = frames.frame_sources(paths)[slice(*frame_range)]
+            video_path = video_template.format(run=run_id)
+            os.makedirs(os.path.dirname(video_path) or '.', exist_ok=True)
+            written = video.export_video(sources, video_path, fps=fps, codec=codec, workers=run.get('workers'), **movie)
+            print("{} frames written to {}".format(written, video_path))
+    return stages
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vertex model post-processing pipeline")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="run the stages declared in a TOML configuration")
+    run_parser.add_argument('config', help="configuration file")
+    run_parser.add_argument('--workers', type=int, default=None, help="override the number of worker processes")
+    run_parser.add_argument('--dry-run', action='store_true', help="only print the stages that would run")
+    commands.add_parser('example', help="print an example configuration")
+    args = parser.parse_args(argv)
+
+    if args.command == 'example':
+        print(EXAMPLE_CONFIG, end='')
+        return
+    try:
+        config = load_config(args.config)
+        stages = check_config(config)
+    except (OSError, ValueError, ImportError) as err:
+        parser.error(str(err))
+    if args.workers is not None:
+        config.setdefault('run', {})['workers'] = args.workers
+    print("stages: {}".format(', '.join(stages)))
+    if not args.dry_run:
+        run_pipeline(config)
+
+if __name__ == "__main__":
+    main()
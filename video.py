@@ -0,0 +1,164 @@
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+import frames
+import utils
+
+# one loader and handle pool per worker process, so frames with unchanged topology skip decoding
+# it again and consecutive frames of a multi-timestep file do not reopen it
+_loader = frames.FrameLoader(('pos', 'Vneighs', 'cellVer', 'cellVerNum', 'cellType', 'BoxMatrix'))
+_datasets = frames.DatasetPool(max_open=4)
+# the rasterizer of a worker process, built once by init_worker (its background image is too big
+# to send along with every frame)
+_rasterizer = None
+
+SUBPIXEL_BITS = 4
+
+class FrameRasterizer(object):
+    """
+    Rasterizes the cell edges and the filled mesectoderm cells of a frame straight into a
+    NumPy BGR image with OpenCV (no matplotlib figure involved).
+
+    size : (width, height) of the images in pixels
+    axis_window : [x0, x1, y0, y1] region of the simulation box shown, or None for the whole box
+    fill_colour, edge_colour, background : BGR colours
+    """
+    def __init__(self, size=(1024, 1024), axis_window=None, fill_colour=(225, 201, 165),
+                 edge_colour=(0, 0, 0), background=(255, 255, 255), fill_mesectoderm=True, line_width=1):
+        self.width, self.height = size
+        self.axis_window = axis_window
+        self.fill_colour = fill_colour
+        self.edge_colour = edge_colour
+        # blank image copied for every frame (a plain memcpy, much faster than broadcasting)
+        self.background = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.background[:] = np.array(background, dtype=np.uint8)
+        self.fill_mesectoderm = fill_mesectoderm
+        self.line_width = line_width
+
+    def to_pixels(self, coords, window):
+        """Converts simulation coordinates (..., 2) to fixed point pixel coordinates, with the
+        image y axis pointing down."""
+        x0, x1, y0, y1 = window
+        scale = 1 << SUBPIXEL_BITS
+        px = (coords[..., 0] - x0) * (self.width / (x1 - x0)) * scale
+        py = (y1 - coords[..., 1]) * (self.height / (y1 - y0)) * scale
+        return np.stack([px, py], axis=-1).round().astype(np.int32)
+
+    def render(self, frame):
+        """
+        frame : frames.Frame with pos, Vneighs and BoxMatrix (and cellVer, cellVerNum and
+                cellType to fill the mesectoderm cells)
+        return : numpy.ndarray : (height, width, 3) uint8 BGR image
+        """
+        box = utils.get_box_lengths(frame['BoxMatrix'])
+        window = self.axis_window if self.axis_window is not None else (0, box[0], 0, box[1])
+        image = self.background.copy()
+
+        if self.fill_mesectoderm:
+            polygons, counts = utils.get_cell_polygons(frame['pos'], frame['cellVer'], frame['cellVerNum'],
+                                                       box, cells=frame['cellType'] == 1)
+            polygons, counts = utils.periodic_copies(polygons, counts, box)
+            pixels = self.to_pixels(polygons, window)
+            # fillPoly takes a list of polygons; group the cells by vertex count to pass arrays
+            for count in np.unique(counts):
+                cv2.fillPoly(image, list(pixels[counts == count, :count]), self.fill_colour,
+                             lineType=cv2.LINE_8, shift=SUBPIXEL_BITS)
+
+        segments = utils.build_edge_segments(frame['pos'], frame['Vneighs'], box, unique=True)
+        cv2.polylines(image, list(self.to_pixels(segments, window)), False, self.edge_colour,
+                      thickness=self.line_width, lineType=cv2.LINE_AA, shift=SUBPIXEL_BITS)
+        return image
+
+def init_worker(render_options):
+    """
+    Builds the FrameRasterizer of a worker process from the keyword arguments of FrameRasterizer
+
+    return : none
+    """
+    global _rasterizer
+    _rasterizer = FrameRasterizer(**render_options)
+
+def render_source(source, rasterizer=None):
+    """
+    Reads and rasterizes one frame
+
+    source : (path, time index) of the frame
+    rasterizer : FrameRasterizer to use (the worker's, see init_worker, if not given)
+    return : numpy.ndarray : the BGR image
+    """
+    path, num_it = source
+    frame = _loader.load(_datasets.get(path), num_it)
+    return (rasterizer or _rasterizer).render(frame)
+
+def list_sources(file_pattern):
+    """
+    Lists every frame of every nc file matching the pattern, in natural run/timestep order;
+    works for directories of single-frame files as well as multi-timestep files
+
+    return : list : (path, time index) pairs
+    """
+    return frames.frame_sources(frames.FrameSequence(file_pattern).paths)
+
+def export_video(sources, video_path, fps=24, codec='mp4v', workers=None, max_pending=None, **render_options):
+    """
+    Renders frames in parallel worker processes and writes them, in order, to a video file
+
+    sources : (path, time index) pairs of the frames (see list_sources)
+    fps : frames per second of the video
+    codec : fourcc code of the video codec
+    workers : number of worker processes (defaults to the number of cpus)
+    max_pending : number of frames rendered ahead of the writer (defaults to twice the number of
+                  workers), which bounds the memory held by finished frames
+    render_options : keyword arguments of FrameRasterizer
+    return : int : the number of frames written
+    """
+    rasterizer = FrameRasterizer(**render_options)
+    video = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*codec), fps,
+                            (rasterizer.width, rasterizer.height))
+    if not video.isOpened():
+        raise IOError("could not open video writer for {} with codec {}".format(video_path, codec))
+
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 2 * workers
+    written = 0
+    try:
+        # every worker builds its own rasterizer once, so only the sources are sent per frame
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(render_options,)) as pool:
+            pending = deque()
+            for source in sources:
+                pending.append(pool.submit(render_source, source))
+                if len(pending) >= max_pending:
+                    video.write(pending.popleft().result())
+                    written += 1
+            while pending:
+                video.write(pending.popleft().result())
+                written += 1
+    finally:
+        video.release()
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a vertex model run straight to a video file")
+    parser.add_argument('pattern', help="glob pattern of the nc files (single- or multi-timestep)")
+    parser.add_argument('video', help="output video file")
+    parser.add_argument('--fps', type=float, default=24)
+    parser.add_argument('--codec', default='mp4v', help="fourcc code of the codec")
+    parser.add_argument('--size', type=int, nargs=2, default=(1024, 1024), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--axis-window', type=float, nargs=4, default=None, metavar=('X0', 'X1', 'Y0', 'Y1'))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-fill', action='store_true', help="do not fill the mesectoderm cells")
+    args = parser.parse_args(argv)
+
+    written = export_video(list_sources(args.pattern), args.video, fps=args.fps, codec=args.codec,
+                           workers=args.workers, size=tuple(args.size), axis_window=args.axis_window,
+                           fill_mesectoderm=not args.no_fill)
+    print("{} frames written to {}".format(written, args.video))
+
+if __name__ == "__main__":
+    main()